@@ -1,10 +1,25 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from telegram_client import TelegramBot
-from database import db
 import os
 import asyncio
+import inspect
 from functools import wraps
 
+# SERVE_MODE=asgi runs the same routes on Quart (served by uvicorn workers), so every
+# worker keeps one long-lived event loop and concurrent Telegram-bound requests share it.
+# SERVE_MODE=wsgi (default) keeps plain Flask, where each async view gets its own loop
+# (Flask needs its "async" extra for that, hence flask[async] in requirements.txt).
+# The Procfile reads the same variable to pick the gunicorn worker class.
+SERVE_MODE = os.environ.get("SERVE_MODE", "wsgi").lower()
+ASGI_MODE = SERVE_MODE == "asgi"
+
+if ASGI_MODE:
+    from quart import Quart as Flask, render_template, request, jsonify, session, redirect, url_for
+else:
+    from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+
+from telegram_client import TelegramBot
+from db_helper import db
+from profiling import PROFILE_DIR, should_profile, start_profile, stop_profile
+
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_for_demo'  # Change this!
 
@@ -12,30 +27,63 @@ app.secret_key = 'super_secret_key_for_demo'  # Change this!
 # Key: phone_number, Value: { 'client': Client, 'phone_code_hash': str }
 login_states = {}
 
+# Flask returns these directly, Quart returns awaitables; these helpers hide the difference.
+async def resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+async def get_request_json():
+    return await resolve(request.get_json())
+
+async def render(template, **context):
+    return await resolve(render_template(template, **context))
+
+async def run_db(fn, *args):
+    # Appwrite calls are blocking HTTP requests; keep them off the shared loop in ASGI mode.
+    # The local JSON file store stays on the loop so its writes are never interleaved.
+    if ASGI_MODE and hasattr(db, 'databases'):
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+def profiled(f):
+    # Wraps the view rather than using before/after hooks: Flask runs async views on a separate
+    # loop thread, and cProfile only sees the thread it was enabled on
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        profiler = start_profile() if should_profile(request.headers) else None
+        if not profiler:
+            return await f(*args, **kwargs)
+        try:
+            return await f(*args, **kwargs)
+        finally:
+            stop_profile(profiler, request.method, request.path)
+    return decorated_function
+
 def login_required(f):
     @wraps(f)
-    def decorated_function(*args, **kwargs):
+    async def decorated_function(*args, **kwargs):
         if 'user_phone' not in session:
             return redirect(url_for('index'))
-        return f(*args, **kwargs)
+        return await f(*args, **kwargs)
     return decorated_function
 
 @app.route('/')
-def index():
+async def index():
     if 'user_phone' in session:
         return redirect(url_for('dashboard'))
-    return render_template('index.html')
+    return await render('index.html')
 
 @app.route('/dashboard')
 @login_required
-def dashboard():
-    user = db.get_user(session['user_phone'])
-    schedules = db.get_user_schedules(session['user_phone'])
-    return render_template('dashboard.html', user=user, schedules=schedules)
+async def dashboard():
+    user = await run_db(db.get_user, session['user_phone'])
+    schedules = await run_db(db.get_user_schedules, session['user_phone'])
+    return await render('dashboard.html', user=user, schedules=schedules)
 
 @app.route('/api/send_code', methods=['POST'])
 async def send_code():
-    data = request.json
+    data = await get_request_json()
     phone = data.get('phone')
     
     bot = TelegramBot()
@@ -54,7 +102,7 @@ async def send_code():
 
 @app.route('/api/verify_code', methods=['POST'])
 async def verify_code():
-    data = request.json
+    data = await get_request_json()
     phone = data.get('phone')
     code = data.get('code')
     
@@ -66,7 +114,7 @@ async def verify_code():
     
     try:
         session_string = await bot.verify_code(phone, phone_code_hash, code)
-        db.save_user(phone, session_string)
+        await run_db(db.save_user, phone, session_string)
         session['user_phone'] = phone
         del login_states[phone]
         return jsonify({'status': 'success', 'redirect': '/dashboard'})
@@ -85,7 +133,7 @@ async def verify_password():
 @app.route('/api/groups', methods=['GET'])
 @login_required
 async def get_groups():
-    user = db.get_user(session['user_phone'])
+    user = await run_db(db.get_user, session['user_phone'])
     bot = TelegramBot(user['session_string'])
     try:
         groups = await bot.get_groups()
@@ -95,54 +143,52 @@ async def get_groups():
 
 @app.route('/api/schedule', methods=['POST'])
 @login_required
-def create_schedule():
-    data = request.json
+async def create_schedule():
+    data = await get_request_json()
     message = data.get('message')
     groups = data.get('groups') # List of chat_ids
     interval = int(data.get('interval'))
+    if not isinstance(groups, list) or not all(type(chat_id) is int for chat_id in groups):
+        return jsonify({'status': 'error', 'message': 'groups must be a list of integer chat IDs'}), 400
     
-    db.add_schedule(session['user_phone'], message, groups, interval)
+    await run_db(db.add_schedule, session['user_phone'], message, groups, interval)
     return jsonify({'status': 'success'})
 
 @app.route('/admin')
 @login_required
-def admin():
-    user = db.get_user(session['user_phone'])
+async def admin():
+    user = await run_db(db.get_user, session['user_phone'])
     if user.get('role') != 'admin':
         return "Access Denied", 403
     
-    users = db.get_all_users()
-    return render_template('admin.html', users=users)
+    users = await run_db(db.get_all_users)
+    return await render('admin.html', users=users)
 
 @app.route('/api/admin/user_status', methods=['POST'])
 @login_required
-def update_user_status():
-    user = db.get_user(session['user_phone'])
+async def update_user_status():
+    user = await run_db(db.get_user, session['user_phone'])
     if user.get('role') != 'admin':
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
     
-    data = request.json
+    data = await get_request_json()
     target_phone = data.get('phone')
     is_active = data.get('is_active')
     
-    # In a real DB, we would update the user. 
-    # Our simple DB abstraction needs an update method.
-    # For now, we'll just hack it by accessing the list directly via get_user (reference)
-    # or adding a method to Database class.
-    # Let's add a method to Database class first or just modify the dict if it's a reference.
-    # get_user returns a reference to the dict in the list, so modifying it works if we save.
-    
-    target_user = db.get_user(target_phone)
-    if target_user:
-        target_user['is_active'] = is_active
-        db._save() # Accessing protected method for brevity in this demo
+    if await run_db(db.update_user_status, target_phone, is_active):
         return jsonify({'status': 'success'})
     return jsonify({'status': 'error', 'message': 'User not found'}), 404
 
 @app.route('/logout')
-def logout():
+async def logout():
     session.pop('user_phone', None)
     return redirect(url_for('index'))
 
+if PROFILE_DIR:
+    # Only wrapped when profiling is configured, so there is no per-request cost otherwise
+    for endpoint, view in list(app.view_functions.items()):
+        if inspect.iscoroutinefunction(view):
+            app.view_functions[endpoint] = profiled(view)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
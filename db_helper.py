@@ -1,4 +1,6 @@
 import json
+import logging
+import hashlib
 import os
 import time
 from typing import List, Dict, Optional
@@ -6,6 +8,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Env vars for Appwrite
 APPWRITE_ENDPOINT = os.environ.get("APPWRITE_ENDPOINT")
 APPWRITE_PROJECT_ID = os.environ.get("APPWRITE_PROJECT_ID")
@@ -14,6 +18,19 @@ DATABASE_ID = os.environ.get("DATABASE_ID", "telegram_bot_db")
 USERS_COLLECTION_ID = os.environ.get("USERS_COLLECTION_ID", "users")
 SCHEDULES_COLLECTION_ID = os.environ.get("SCHEDULES_COLLECTION_ID", "schedules")
 
+# Must match the ID helpers in main.py: documents are keyed by their natural keys
+def user_doc_id(phone: str) -> str:
+    return "u" + hashlib.sha1(phone.encode()).hexdigest()[:35]
+
+def schedule_doc_id(user_phone: str, created_ms: int) -> str:
+    return "s" + hashlib.sha1(user_phone.encode()).hexdigest()[:16] + "-" + str(created_ms)
+
+# Must match USER_LIST_FIELDS in main.py: what the admin page may see of a user (no session strings)
+USER_LIST_FIELDS = ["phone", "role", "is_active", "breaker_state", "breaker_reason"]
+
+def project_user(user: Dict) -> Dict:
+    return {field: user.get(field) for field in USER_LIST_FIELDS}
+
 class LocalDatabase:
     def __init__(self):
         # Use /tmp for Appwrite Function environment (read-only root)
@@ -32,6 +49,12 @@ class LocalDatabase:
         with open(self.file, 'w') as f:
             json.dump(self.data, f, indent=4)
 
+    def _bump_counter(self, name: str, delta: int):
+        # main.py keeps these for /admin/stats; a file without them is counted when main.py loads it
+        counters = self.data.get("counters")
+        if counters is not None:
+            counters[name] = counters.get(name, 0) + delta
+
     def get_user(self, phone: str) -> Optional[Dict]:
         for user in self.data["users"]:
             if user["phone"] == phone:
@@ -50,28 +73,37 @@ class LocalDatabase:
                 "role": role,
                 "is_active": True
             })
+            self._bump_counter("total_users", 1)
+            self._bump_counter("active_users", 1)
         self._save()
     
     def update_user_status(self, phone: str, is_active: bool):
         user = self.get_user(phone)
         if user:
+            if bool(user.get("is_active", True)) != bool(is_active):
+                self._bump_counter("active_users", 1 if is_active else -1)
             user["is_active"] = is_active
             self._save()
             return True
         return False
 
     def get_all_users(self) -> List[Dict]:
-        return self.data["users"]
+        return [project_user(u) for u in self.data["users"]]
 
     def add_schedule(self, user_phone: str, message: str, groups: List[int], interval_minutes: int):
         self.data["schedules"].append({
-            "id": str(int(time.time() * 1000)),
+            "$id": schedule_doc_id(user_phone, int(time.time() * 1000)),
             "user_phone": user_phone,
             "message": message,
             "groups": groups,
             "interval_minutes": interval_minutes,
             "last_run": 0
         })
+        self._bump_counter("schedules", 1)
+        # main.py's /schedules ETag is built from this, so the dashboard sees the new schedule
+        user = self.get_user(user_phone)
+        if user:
+            user["schedules_version"] = user.get("schedules_version", 0) + 1
         self._save()
 
     def get_user_schedules(self, user_phone: str) -> List[Dict]:
@@ -87,7 +119,7 @@ class LocalDatabase:
 
     def update_last_run(self, schedule_id: str):
         for schedule in self.data["schedules"]:
-            if schedule["id"] == schedule_id:
+            if schedule.get("$id", schedule.get("id")) == schedule_id:
                 schedule["last_run"] = time.time()
                 break
         self._save()
@@ -97,6 +129,7 @@ class AppwriteDatabase:
         from appwrite.client import Client
         from appwrite.services.databases import Databases
         from appwrite.query import Query
+        from appwrite.exception import AppwriteException
         
         self.client = Client()
         self.client.set_endpoint(APPWRITE_ENDPOINT)
@@ -104,35 +137,33 @@ class AppwriteDatabase:
         self.client.set_key(APPWRITE_API_KEY)
         self.databases = Databases(self.client)
         self.Query = Query
+        self.AppwriteException = AppwriteException
 
-    def get_user(self, phone: str) -> Optional[Dict]:
+    def _update_user(self, phone: str, data: Dict) -> bool:
         try:
-            result = self.databases.list_documents(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                [self.Query.equal("phone", phone)]
-            )
-            if result['documents']:
-                return result['documents'][0]
+            self.databases.update_document(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(phone), data)
+            return True
+        except self.AppwriteException as e:
+            if e.code == 404:
+                return False
+            raise
+
+    def get_user(self, phone: str) -> Optional[Dict]:
+        if not phone:
             return None
-        except Exception as e:
-            print(f"Appwrite Error: {e}")
+        try:
+            return self.databases.get_document(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(phone))
+        except self.AppwriteException as e:
+            if e.code != 404:
+                logger.error("Appwrite error: %s", e)
             return None
 
     def save_user(self, phone: str, session_string: str, role: str = "subscriber"):
-        user = self.get_user(phone)
-        if user:
-            self.databases.update_document(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                user['$id'],
-                {"session_string": session_string}
-            )
-        else:
+        if not self._update_user(phone, {"session_string": session_string}):
             self.databases.create_document(
                 DATABASE_ID,
                 USERS_COLLECTION_ID,
-                'unique()',
+                user_doc_id(phone),
                 {
                     "phone": phone,
                     "session_string": session_string,
@@ -142,21 +173,12 @@ class AppwriteDatabase:
             )
 
     def update_user_status(self, phone: str, is_active: bool):
-        user = self.get_user(phone)
-        if user:
-            self.databases.update_document(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                user['$id'],
-                {"is_active": is_active}
-            )
-            return True
-        return False
+        return self._update_user(phone, {"is_active": is_active})
 
     def get_all_users(self) -> List[Dict]:
         try:
-            result = self.databases.list_documents(DATABASE_ID, USERS_COLLECTION_ID)
-            return result['documents']
+            result = self.databases.list_documents(DATABASE_ID, USERS_COLLECTION_ID, [self.Query.select(USER_LIST_FIELDS)])
+            return [project_user(u) for u in result['documents']]
         except:
             return []
 
@@ -168,7 +190,7 @@ class AppwriteDatabase:
         self.databases.create_document(
             DATABASE_ID,
             SCHEDULES_COLLECTION_ID,
-            'unique()',
+            schedule_doc_id(user_phone, int(time.time() * 1000)),
             {
                 "user_phone": user_phone,
                 "message": message,
@@ -177,6 +199,15 @@ class AppwriteDatabase:
                 "last_run": 0
             }
         )
+        self._bump_schedules_version(user_phone)
+
+    def _bump_schedules_version(self, user_phone: str):
+        # main.py's /schedules ETag is built from this, so the dashboard sees the new schedule
+        try:
+            self.databases.increment_document_attribute(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(user_phone), "schedules_version", 1)
+        except self.AppwriteException as e:
+            if e.code != 404:
+                raise
 
     def get_user_schedules(self, user_phone: str) -> List[Dict]:
         try:
@@ -208,7 +239,7 @@ class AppwriteDatabase:
                     due.append(schedule)
             return due
         except Exception as e:
-            print(f"Error fetching schedules: {e}")
+            logger.error("Error fetching schedules: %s", e)
             return []
 
     def update_last_run(self, schedule_id: str):
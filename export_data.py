@@ -0,0 +1,69 @@
+from main import db, EXPORT_FIELDS, EXPORT_FORMATS, export_fields, encode_rows, decode_rows
+import argparse
+import sys
+
+# Full dumps of the users and schedules collections for audits and migrations. Rows are
+# streamed a backend page at a time, so memory stays flat however large the collection.
+#
+#   python export_data.py export users --format csv > users.csv
+#   python export_data.py export users --include-sessions > users.ndjson
+#   python export_data.py import users users.ndjson
+#   python export_data.py import schedules schedules.csv
+#
+# Imports upsert by phone / schedule ID into whichever backend main.py is configured for.
+# Users are only imported with their session string, so dump them with --include-sessions
+# (and keep that file as safe as the sessions themselves).
+
+def guess_format(path):
+    return "csv" if path and path.endswith(".csv") else "ndjson"
+
+def export(kind, fmt, include_sessions, out):
+    fields = export_fields(kind, include_sessions)
+    count = 0
+    def rows():
+        nonlocal count
+        for row in db.iter_users(fields) if kind == "users" else db.iter_schedules(fields):
+            count += 1
+            yield row
+    for chunk in encode_rows(rows(), fields, fmt):
+        out.write(chunk)
+    out.flush()
+    print(f"Exported {count} {kind}.", file=sys.stderr)
+
+def import_(kind, path, fmt):
+    with (open(path, 'r', newline='') if path != "-" else sys.stdin) as f:
+        read = 0
+        def rows():
+            nonlocal read
+            for row in decode_rows(f, fmt):
+                read += 1
+                yield row
+        imported = db.import_users(rows()) if kind == "users" else db.import_schedules(rows())
+    skipped = read - imported
+    print(f"Imported {imported} {kind}" + (f", skipped {skipped} without a session string" if skipped else "") + ".", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import users and schedules as CSV or NDJSON.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    exp = commands.add_parser("export", help="write a collection to stdout or a file")
+    exp.add_argument("kind", choices=list(EXPORT_FIELDS))
+    exp.add_argument("--format", choices=EXPORT_FORMATS)
+    exp.add_argument("--output", "-o", help="file to write (default: stdout)")
+    exp.add_argument("--include-sessions", action="store_true", help="include users' session strings")
+
+    imp = commands.add_parser("import", help="load a dump into the configured backend")
+    imp.add_argument("kind", choices=list(EXPORT_FIELDS))
+    imp.add_argument("path", help="file to read, or - for stdin")
+    imp.add_argument("--format", choices=EXPORT_FORMATS)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        fmt = args.format or guess_format(args.output)
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                export(args.kind, fmt, args.include_sessions, out)
+        else:
+            export(args.kind, fmt, args.include_sessions, sys.stdout)
+    else:
+        import_(args.kind, args.path, args.format or guess_format(args.path))
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Replays recorded requests against main.main(context) with Telegram stubbed out and a
+# throwaway local database, and reports latency percentiles per route.
+#
+# Record real traffic by deploying with RECORD_TRAFFIC_FILE=/tmp/traffic.jsonl, or create a
+# synthetic mix with `python loadtest.py generate`. Then:
+#
+#   python loadtest.py replay traffic.jsonl --concurrency 20 --repeat 5
+#   python loadtest.py replay traffic.jsonl --save-report baseline.json
+#   python loadtest.py replay traffic.jsonl --baseline baseline.json   # exits 1 on regressions
+
+# main.py reads its configuration at import time, so point it at local storage first
+WORKDIR = tempfile.mkdtemp(prefix="loadtest-")
+os.environ["APPWRITE_ENDPOINT"] = ""
+os.environ["LOCAL_DB_FILE"] = os.path.join(WORKDIR, "db.json")
+os.environ["DELIVERY_LOG_FILE"] = os.path.join(WORKDIR, "deliveries.jsonl")
+os.environ["LEDGER_FILE"] = os.path.join(WORKDIR, "delivery_ledger.jsonl")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "loadtest")
+os.environ.pop("RECORD_TRAFFIC_FILE", None)
+
+import main
+
+# --- Fake Appwrite Function context ---
+
+class FakeRequest:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = json.dumps(body) if isinstance(body, dict) else body
+
+class FakeResponse:
+    def json(self, body, status=200, headers=None):
+        return {"status": status, "body": body, "headers": headers or {}}
+
+    def send(self, body, status=200, headers=None):
+        return {"status": status, "body": body, "headers": headers or {}}
+
+    def text(self, body, status=200, headers=None):
+        return self.send(body, status, headers)
+
+    def empty(self):
+        return self.send("", 204)
+
+class FakeContext:
+    def __init__(self, entry):
+        self.req = FakeRequest(entry["method"], entry["path"], entry.get("headers") or {}, entry.get("body") or {})
+        self.res = FakeResponse()
+
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        print(f"ERROR {self.req.path}: {message}", file=sys.stderr)
+
+# --- Stubbed Telegram ---
+
+class StubTelegramBot:
+    # Same surface as main.TelegramBot; every Telegram call just sleeps for a jittered latency
+    latency = 0.05
+    group_count = 20
+
+    def __init__(self, session_string: str = None):
+        self.session_string = session_string
+        self.connected = False
+
+    async def _rpc(self):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    async def connect(self):
+        await self._rpc()
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    @property
+    def is_connected(self):
+        return self.connected
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    async def send_code(self, phone_number):
+        await self._rpc()
+        return "stub-hash", "stub-partial-session"
+
+    async def verify_code(self, phone_number, phone_code_hash, code, partial_session=None):
+        await self._rpc()
+        return f"stub-session-{phone_number}"
+
+    async def get_groups(self):
+        await self._rpc()
+        return [{"id": -1000000000000 - i, "title": f"Group {i}"} for i in range(self.group_count)]
+
+    async def get_chat_capabilities(self, chat_id):
+        await self._rpc()
+        return {"can_send": True, "can_send_media": True, "slow_mode_delay": 0, "reason": ""}
+
+    async def send_message(self, chat_id, text):
+        await self._rpc()
+
+    async def send_media(self, chat_id, media_type, media, caption=None):
+        await self._rpc()
+        return "stub-file-id"
+
+# --- Traffic ---
+
+def load_traffic(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def seed(traffic):
+    # Every phone seen in the traffic becomes a user; phones that call /admin/* become admins
+    sessions = {}
+    admins = set()
+    for entry in traffic:
+        body = entry.get("body") or {}
+        phone = body.get("user_phone") or body.get("phone")
+        if not phone:
+            continue
+        if body.get("session_string"):
+            sessions[phone] = body["session_string"]
+        sessions.setdefault(phone, f"stub-session-{phone}")
+        if entry["path"].startswith("/admin/"):
+            admins.add(phone)
+        if body.get("target_phone"):
+            sessions.setdefault(body["target_phone"], f"stub-session-{body['target_phone']}")
+    for phone, session_string in sessions.items():
+        main.db.save_user(phone, session_string, "admin" if phone in admins else "subscriber")
+    # save_user keeps the role of existing users; make sure admins really are admins
+    for phone in admins:
+        main.db.get_user(phone)["role"] = "admin"
+    main.db._save()
+    return len(sessions)
+
+def generate(path, users, requests):
+    phones = [f"+1555{i:07d}" for i in range(users)]
+    entries = []
+    for i in range(requests):
+        phone = random.choice(phones)
+        session = f"stub-session-{phone}"
+        roll = random.random()
+        if roll < 0.35:
+            entry = {"method": "POST", "path": "/schedules", "body": {"user_phone": phone}}
+        elif roll < 0.6:
+            entry = {"method": "POST", "path": "/groups", "body": {"user_phone": phone, "session_string": session}}
+        elif roll < 0.75:
+            entry = {"method": "POST", "path": "/schedule", "body": {
+                "user_phone": phone,
+                "message": f"Load test message {i}",
+                "groups": [-1000000000000 - g for g in range(5)],
+                "interval": random.choice([5, 10, 30])
+            }}
+        elif roll < 0.85:
+            entry = {"method": "POST", "path": "/admin/users", "body": {"user_phone": phones[0]}}
+        elif roll < 0.95:
+            entry = {"method": "POST", "path": "/admin/stats", "body": {"user_phone": phones[0]}}
+        else:
+            entry = {"method": "POST", "path": "/cron", "body": {}}
+        entry["headers"] = {"content-type": "application/json"}
+        entries.append(entry)
+    with open(path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    print(f"Wrote {len(entries)} requests for {users} users to {path}")
+
+# --- Replay ---
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def replay(traffic, concurrency, repeat):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {}
+    errors = {}
+
+    async def run(entry):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await main.main(FakeContext(entry))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        route = entry["path"]
+        latencies.setdefault(route, []).append(elapsed_ms)
+        if response["status"] >= 500:
+            errors[route] = errors.get(route, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(entry) for _ in range(repeat) for entry in traffic))
+    return latencies, errors, time.perf_counter() - started
+
+def build_report(latencies, errors):
+    report = {}
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        report[route] = {
+            "count": len(values),
+            "errors": errors.get(route, 0),
+            "p50": round(percentile(values, 50), 2),
+            "p90": round(percentile(values, 90), 2),
+            "p99": round(percentile(values, 99), 2),
+            "max": round(values[-1], 2)
+        }
+    return report
+
+def print_report(report, wall_seconds):
+    print(f"{'route':<24}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    total = 0
+    for route, row in report.items():
+        total += row["count"]
+        print(f"{route:<24}{row['count']:>8}{row['errors']:>8}{row['p50']:>10}{row['p90']:>10}{row['p99']:>10}{row['max']:>10}")
+    print(f"{total} requests in {wall_seconds:.2f}s ({total / wall_seconds:.1f} req/s)")
+
+def compare(report, baseline, tolerance):
+    # A route regresses when its p90 grows by more than `tolerance` (0.2 = 20%) or it starts erroring
+    regressions = []
+    for route, row in report.items():
+        base = baseline.get(route)
+        if not base:
+            continue
+        if base["p90"] and row["p90"] > base["p90"] * (1 + tolerance):
+            regressions.append(f"{route}: p90 {base['p90']} -> {row['p90']} ms")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{route}: errors {base['errors']} -> {row['errors']}")
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against main(context).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="write a synthetic traffic file")
+    gen.add_argument("path", nargs="?", default="traffic.jsonl")
+    gen.add_argument("--users", type=int, default=50)
+    gen.add_argument("--requests", type=int, default=1000)
+
+    rep = commands.add_parser("replay", help="replay a traffic file and report latency per route")
+    rep.add_argument("path", nargs="?", default="traffic.jsonl")
+    rep.add_argument("--concurrency", type=int, default=10)
+    rep.add_argument("--repeat", type=int, default=1)
+    rep.add_argument("--telegram-latency", type=float, default=StubTelegramBot.latency, help="seconds per stubbed Telegram call")
+    rep.add_argument("--save-report", help="write the per-route report as JSON")
+    rep.add_argument("--baseline", help="compare against a report saved earlier")
+    rep.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(args.path, args.users, args.requests)
+        return
+
+    StubTelegramBot.latency = args.telegram_latency
+    main.TelegramBot = StubTelegramBot
+    traffic = load_traffic(args.path)
+    print(f"Seeded {seed(traffic)} users; replaying {len(traffic)} requests x{args.repeat} at concurrency {args.concurrency}")
+
+    latencies, errors, wall_seconds = asyncio.run(replay(traffic, args.concurrency, args.repeat))
+    report = build_report(latencies, errors)
+    print_report(report, wall_seconds)
+
+    if args.save_report:
+        with open(args.save_report, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
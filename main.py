@@ -1,32 +1,193 @@
 import json
+import logging
+import logging.handlers
+import array
 import asyncio
+import csv
+import fcntl
+import atexit
+import cProfile
+import hashlib
+import io
+import itertools
 import os
+import queue
+import random
+import re
+import sys
+import threading
 import time
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 from pyrogram import Client
-from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PasswordHashInvalid, PhoneCodeExpired
+from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PasswordHashInvalid, PhoneCodeExpired, Unauthorized
+from pyrogram.errors import FileReferenceExpired, FileReferenceInvalid, MediaEmpty
+from pyrogram.errors import ChatWriteForbidden, ChatRestricted, ChatAdminRequired, ChannelPrivate, UserBannedInChannel, UserNotParticipant, ChatSendMediaForbidden, SlowmodeWait
+from pyrogram.enums import ChatMemberStatus
 
 load_dotenv()
 
+# --- Logging ---
+# LOG_LEVEL sets the threshold; below it a call costs one level check, and arguments are only
+# %-formatted for records that are actually written. Each message template is written at most
+# LOG_RATE_LIMIT times per LOG_RATE_WINDOW_SECONDS (0 disables the limit), and a call can pass
+# extra={'sample_rate': 0.01} to keep only that fraction of a high-volume message.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", "20"))
+LOG_RATE_WINDOW_SECONDS = int(os.environ.get("LOG_RATE_WINDOW_SECONDS", "60"))
+# Fraction of requests that get an INFO "method path" line
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get("LOG_REQUEST_SAMPLE_RATE", "0.01"))
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit: int, window: int):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (logger, level, template) -> [window start, written, suppressed]
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        sample_rate = getattr(record, 'sample_rate', None)
+        if sample_rate is not None and random.random() >= sample_rate:
+            return False
+        if not self.limit:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.window:
+                if window and window[2]:
+                    # First record of a new window reports how many the last one dropped
+                    record.suppressed = window[2]
+                self.windows[key] = [now, 1, 0]
+                return True
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'msg': record.getMessage()}
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            # logger.exception(): keep the traceback the old print_exc() calls showed
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message in the caller's thread so the record can be
+    # pickled. This queue never leaves the process, so the record is enqueued as is and the
+    # listener does all the formatting. Log arguments are rendered in the listener, after the
+    # call returns, so pass values rather than objects that are about to change.
+    def prepare(self, record):
+        return record
+
+def configure_logging() -> logging.Logger:
+    log = logging.getLogger("scheduler")
+    if log.handlers:
+        return log
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+    # Callers only enqueue; a background thread does the formatting and stdout writes
+    records = queue.SimpleQueue()
+    handler = RecordQueueHandler(records)
+    handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_WINDOW_SECONDS))
+    log.addHandler(handler)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    return log
+
+logger = configure_logging()
+
 # --- Environment Variables ---
 # --- Environment Variables ---
 API_ID_RAW = os.environ.get("API_ID")
 try:
     API_ID = int(API_ID_RAW) if API_ID_RAW else None
 except ValueError:
-    print(f"Error: API_ID is not an integer: {API_ID_RAW}")
+    logger.error("API_ID is not an integer: %s", API_ID_RAW)
     API_ID = None
 
 API_HASH = os.environ.get("API_HASH")
-print(f"DEBUG: API_ID={API_ID}, API_HASH={API_HASH}") # Debug log
-print(f"DEBUG: API_ID={API_ID}, API_HASH={API_HASH}") # Debug log
 APPWRITE_ENDPOINT = os.environ.get("APPWRITE_ENDPOINT")
 APPWRITE_PROJECT_ID = os.environ.get("APPWRITE_PROJECT_ID")
 APPWRITE_API_KEY = os.environ.get("APPWRITE_API_KEY")
 DATABASE_ID = os.environ.get("DATABASE_ID", "telegram_bot_db")
 USERS_COLLECTION_ID = os.environ.get("USERS_COLLECTION_ID", "users")
 SCHEDULES_COLLECTION_ID = os.environ.get("SCHEDULES_COLLECTION_ID", "schedules")
+MEDIA_CACHE_COLLECTION_ID = os.environ.get("MEDIA_CACHE_COLLECTION_ID", "media_cache")
+COUNTERS_COLLECTION_ID = os.environ.get("COUNTERS_COLLECTION_ID", "counters")
+CHAT_CAPS_COLLECTION_ID = os.environ.get("CHAT_CAPS_COLLECTION_ID", "chat_caps")
+DELIVERIES_COLLECTION_ID = os.environ.get("DELIVERIES_COLLECTION_ID", "deliveries")
+LEDGER_COLLECTION_ID = os.environ.get("LEDGER_COLLECTION_ID", "delivery_ledger")
+# Local store file (the Appwrite Function runtime only allows writes under /tmp)
+LOCAL_DB_FILE = os.environ.get("LOCAL_DB_FILE", "/tmp/db.json")
+# When set, every request's method/path/headers/body is appended here for loadtest.py to replay
+RECORD_TRAFFIC_FILE = os.environ.get("RECORD_TRAFFIC_FILE")
+# When set, a PROFILE_SAMPLE_RATE fraction of requests (and any sent with "X-Profile: 1") is run
+# under cProfile and dumped to <PROFILE_DIR>/<method>_<route>-<ns>.prof; see Profiling below
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_HEADER = "x-profile"
+# Append-only delivery log used by the local store (one JSON record per line)
+DELIVERY_LOG_FILE = os.environ.get("DELIVERY_LOG_FILE", "/tmp/deliveries.jsonl")
+# Append-only delivery ledger used by the local store (one claim per line, fsynced)
+LEDGER_FILE = os.environ.get("LEDGER_FILE", "/tmp/delivery_ledger.jsonl")
+# How long a pass may hold a delivery claim before the send is assumed lost (the pass died) and a
+# later pass may take it over
+DELIVERY_CLAIM_LEASE_SECONDS = int(os.environ.get("DELIVERY_CLAIM_LEASE_SECONDS", "300"))
+# Appwrite only: how often one delivery can be taken over before it is treated as held until it expires
+LEDGER_MAX_ATTEMPTS = 10
+# /deliveries page size (default and upper bound)
+DELIVERIES_PAGE_SIZE = 50
+DELIVERIES_MAX_PAGE_SIZE = 200
+# Number of days of send counts returned by /admin/stats
+STATS_DAYS = 7
+# /admin/users page size (default and upper bound)
+ADMIN_PAGE_SIZE = 25
+ADMIN_MAX_PAGE_SIZE = 100
+# The only user fields the admin listing shows; session strings never leave the backend
+USER_LIST_FIELDS = ["phone", "role", "is_active", "breaker_state", "breaker_reason"]
+# How long a user's cached group list is served before Telegram is asked again
+GROUPS_CACHE_TTL_SECONDS = int(os.environ.get("GROUPS_CACHE_TTL_SECONDS", "3600"))
+# How long a chat's posting permissions / slow mode are trusted before they are re-checked
+CHAT_CAPS_TTL_SECONDS = int(os.environ.get("CHAT_CAPS_TTL_SECONDS", "21600"))
+# Scheduler write-behind buffer: flush delivery outcomes and records after this many entries or seconds
+WRITE_BUFFER_MAX_ITEMS = int(os.environ.get("WRITE_BUFFER_MAX_ITEMS", "200"))
+WRITE_BUFFER_MAX_AGE_SECONDS = int(os.environ.get("WRITE_BUFFER_MAX_AGE_SECONDS", "30"))
+# Appwrite bulk calls take at most this many documents / IDs per request
+APPWRITE_BATCH_SIZE = 100
+# Most items /schedules/bulk and /admin/user_status/bulk accept per request
+BULK_MAX_ITEMS = 100
+# Exports read the backend this many documents at a time; /admin/export returns at most
+# EXPORT_MAX_RESPONSE_ROWS rows per call (EXPORT_RESPONSE_ROWS by default)
+EXPORT_PAGE_SIZE = 500
+EXPORT_RESPONSE_ROWS = 1000
+EXPORT_MAX_RESPONSE_ROWS = 5000
+# Columns of the users/schedules exports. session_string is only added by export_data.py
+# --include-sessions; /admin/export never returns it
+EXPORT_FIELDS = {
+    "users": ["phone", "role", "is_active", "breaker_state", "breaker_opened_at", "breaker_reason"],
+    "schedules": ["$id", "user_phone", "message", "groups", "interval_minutes", "last_run", "media_type", "media_url"]
+}
+EXPORT_FORMATS = ("csv", "ndjson")
+# How long an account's breaker stays open before the scheduler probes it again
+BREAKER_COOLDOWN_SECONDS = int(os.environ.get("BREAKER_COOLDOWN_SECONDS", "3600"))
+# Scheduler look-ahead: a pass also picks up schedules due within this many seconds and sends each
+# at its due time. Keep it below the function timeout minus the time a pass needs; 0 = due now only
+PREWARM_HORIZON_SECONDS = int(os.environ.get("PREWARM_HORIZON_SECONDS", "0"))
+# At most this many accounts get their Telegram connection opened ahead of their first send
+PREWARM_MAX_CLIENTS = int(os.environ.get("PREWARM_MAX_CLIENTS", "20"))
 
 # --- Telegram Client (Embedded) ---
 
@@ -51,6 +212,29 @@ class TelegramBot:
         if self.client:
             await self.client.disconnect()
 
+    @property
+    def is_connected(self) -> bool:
+        return bool(self.client and self.client.is_connected)
+
+    # `async with bot:` keeps one connection open for several sends
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    @asynccontextmanager
+    async def _connection(self):
+        if self.is_connected:
+            yield
+            return
+        await self.connect()
+        try:
+            yield
+        finally:
+            await self.disconnect()
+
     async def send_code(self, phone_number: str):
         await self.connect()
         try:
@@ -58,7 +242,7 @@ class TelegramBot:
             phone_code_hash = sent_code.phone_code_hash
             # Export session string to maintain session continuity
             partial_session = await self.client.export_session_string()
-            print(f"DEBUG: Exported partial session string length: {len(partial_session)}")
+            logger.debug("Exported partial session string (%d chars)", len(partial_session))
             await self.disconnect()
             return phone_code_hash, partial_session
         except Exception as e:
@@ -96,26 +280,273 @@ class TelegramBot:
         return groups
 
     async def send_message(self, chat_id: int, text: str):
-        await self.connect()
-        try:
+        async with self._connection():
             await self.client.send_message(chat_id, text)
-        finally:
-            await self.disconnect()
+
+    async def get_chat_capabilities(self, chat_id: int) -> Dict:
+        # What this account may post in the chat right now, from its membership and the chat's permissions
+        async with self._connection():
+            chat = await self.client.get_chat(chat_id)
+            try:
+                member = await self.client.get_chat_member(chat_id, "me")
+            except UserNotParticipant:
+                return {"can_send": False, "can_send_media": False, "slow_mode_delay": 0, "reason": "not a member"}
+
+        if member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR):
+            # Admins are exempt from default permissions and slow mode
+            return {"can_send": True, "can_send_media": True, "slow_mode_delay": 0, "reason": ""}
+        if member.status in (ChatMemberStatus.BANNED, ChatMemberStatus.LEFT):
+            return {"can_send": False, "can_send_media": False, "slow_mode_delay": 0, "reason": member.status.value}
+
+        permissions = member.permissions if member.status == ChatMemberStatus.RESTRICTED else chat.permissions
+        can_send = permissions is None or permissions.can_send_messages is not False
+        return {
+            "can_send": can_send,
+            "can_send_media": can_send and (permissions is None or permissions.can_send_media_messages is not False),
+            # Not every Pyrogram release exposes it; otherwise it is learned from SLOWMODE_WAIT errors
+            "slow_mode_delay": getattr(chat, "slow_mode_delay", None) or 0,
+            "reason": "" if can_send else "read-only"
+        }
+
+    async def send_media(self, chat_id: int, media_type: str, media, caption: str = None) -> str:
+        # `media` is either a cached file_id or an http(s) URL for Telegram to fetch.
+        # Returns the file_id Telegram assigned, for reuse on later sends.
+        async with self._connection():
+            if media_type == "photo":
+                message = await self.client.send_photo(chat_id, media, caption=caption)
+                return message.photo.file_id
+            message = await self.client.send_document(chat_id, media, caption=caption)
+            return message.document.file_id
 
 # --- Database Logic (Embedded) ---
 
+# Documents are keyed by IDs derived from their natural keys, so a lookup is a direct
+# get_document instead of a query, and a write needs no lookup first.
+def user_doc_id(phone: str) -> str:
+    return "u" + hashlib.sha1(phone.encode()).hexdigest()[:35]
+
+def schedule_doc_id(user_phone: str, created_ms: int, seq: Optional[int] = None) -> str:
+    # All of one user's schedules share the prefix; the creation time tells them apart, and
+    # `seq` the schedules created together by one bulk request
+    doc_id = "s" + hashlib.sha1(user_phone.encode()).hexdigest()[:16] + "-" + str(created_ms)
+    return doc_id if seq is None else f"{doc_id}.{seq}"
+
+def chat_ids(groups: Iterable) -> List[int]:
+    # The scheduler packs chat IDs into a 64-bit int array; numeric strings are converted,
+    # anything else is refused before it can be stored
+    ids = []
+    for chat_id in groups:
+        if isinstance(chat_id, bool) or not isinstance(chat_id, (int, str)):
+            raise ValueError(f"invalid chat ID: {chat_id!r}")
+        chat_id = int(chat_id)
+        if not -2**63 <= chat_id < 2**63:
+            raise ValueError(f"invalid chat ID: {chat_id!r}")
+        ids.append(chat_id)
+    return ids
+
+def schedule_document(user_phone: str, message: str, groups: List[int], interval_minutes: int, media: Optional[Dict] = None) -> Dict:
+    schedule = {
+        "user_phone": user_phone,
+        "message": message,
+        "groups": chat_ids(groups),
+        "interval_minutes": interval_minutes,
+        "last_run": 0
+    }
+    if media:
+        schedule["media_type"] = media["type"]
+        schedule["media_url"] = media["url"]
+    return schedule
+
+def schedule_due_at(schedule: Dict) -> float:
+    return schedule.get("last_run", 0) + schedule.get("interval_minutes", 10) * 60
+
+def media_cache_key(phone: str, source: str) -> str:
+    # file_ids are only valid for the account that uploaded the file, so key on both.
+    # 36 hex chars also fits Appwrite's document ID limit.
+    return hashlib.sha1(f"{phone}|{source}".encode()).hexdigest()[:36]
+
+def project_user(user: Dict) -> Dict:
+    return {field: user.get(field) for field in USER_LIST_FIELDS}
+
+def cached_groups(user: Dict) -> Optional[List[Dict]]:
+    # Appwrite stores the list as a JSON string attribute, the local store as a list
+    groups = user.get("groups_cache")
+    if isinstance(groups, str):
+        return json.loads(groups) if groups else None
+    return groups
+
+def delivery_key(schedule_id: str, slot: int, chat_id) -> str:
+    # Idempotency key of one delivery: a schedule's message to one chat in one run slot
+    return hashlib.sha1(f"{schedule_id}|{slot}|{chat_id}".encode()).hexdigest()[:36]
+
+def chat_caps_key(phone: str, chat_id) -> str:
+    return hashlib.sha1(f"{phone}|{chat_id}".encode()).hexdigest()[:36]
+
+def stats_days(days: int = STATS_DAYS) -> List[str]:
+    # Most recent first, as UTC dates (YYYY-MM-DD)
+    now = time.time()
+    return [time.strftime("%Y-%m-%d", time.gmtime(now - i * 86400)) for i in range(days)]
+
+# --- Scheduler Records ---
+# A pass holds every due schedule at once. Instead of whole documents ($permissions,
+# $createdAt, ...) it keeps these: only the fields run_scheduler reads, converted once where
+# they leave the backend, with repeated strings (message bodies, phones, media URLs) interned
+# so identical ones are stored once, and chat IDs packed into a 64-bit int array.
+
+def intern_optional(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+class ScheduleRecord:
+    FIELDS = ["$id", "user_phone", "message", "groups", "interval_minutes", "last_run", "media_type", "media_url"]
+    __slots__ = ("id", "user_phone", "message", "groups", "interval_minutes", "last_run", "media_type", "media_url")
+
+    def __init__(self, id: str, user_phone: str, message: Optional[str], groups: Iterable[int], interval_minutes: int,
+                 last_run: int = 0, media_type: Optional[str] = None, media_url: Optional[str] = None):
+        self.id = id
+        self.user_phone = sys.intern(user_phone)
+        self.message = intern_optional(message)
+        self.groups = array.array('q', groups)
+        self.interval_minutes = interval_minutes
+        self.last_run = last_run
+        self.media_type = intern_optional(media_type)
+        self.media_url = intern_optional(media_url)
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "ScheduleRecord":
+        return cls(
+            document["$id"],
+            document["user_phone"],
+            document.get("message"),
+            chat_ids(document.get("groups") or ()),
+            document.get("interval_minutes", 10),
+            int(document.get("last_run") or 0),
+            document.get("media_type"),
+            document.get("media_url")
+        )
+
+    @property
+    def due_at(self) -> float:
+        return self.last_run + self.interval_minutes * 60
+
+class UserRecord:
+    __slots__ = ("phone", "session_string", "is_active", "breaker_state", "breaker_opened_at", "breaker_reason")
+
+    def __init__(self, phone: str, session_string: Optional[str], is_active: bool = True,
+                 breaker_state: Optional[str] = None, breaker_opened_at: int = 0, breaker_reason: str = ""):
+        self.phone = sys.intern(phone)
+        self.session_string = session_string
+        self.is_active = is_active
+        self.breaker_state = breaker_state
+        self.breaker_opened_at = breaker_opened_at
+        self.breaker_reason = breaker_reason
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "UserRecord":
+        return cls(
+            document["phone"],
+            document.get("session_string"),
+            document.get("is_active", True),
+            document.get("breaker_state"),
+            document.get("breaker_opened_at") or 0,
+            document.get("breaker_reason") or ""
+        )
+
+# --- Export / Import ---
+
+def export_fields(kind: str, include_sessions: bool = False) -> List[str]:
+    return EXPORT_FIELDS[kind] + (["session_string"] if kind == "users" and include_sessions else [])
+
+def encode_rows(rows: Iterable[Dict], fields: List[str], fmt: str, header: bool = True) -> Iterator[str]:
+    # One chunk per row, so a dump is never held in memory as a whole
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    for row in rows:
+        writer.writerow([json.dumps(v) if isinstance(v, (list, dict)) else v for v in (row.get(f) for f in fields)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export
+        yield buffer.getvalue()
+
+def decode_rows(lines: Iterable[str], fmt: str) -> Iterator[Dict]:
+    if fmt == "ndjson":
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        return
+    for row in csv.DictReader(lines):
+        yield {field: csv_value(field, value) for field, value in row.items()}
+
+def csv_value(field: str, value: str):
+    # CSV has no types; restore the ones the exports write
+    if value == "":
+        return None
+    if field == "groups":
+        return json.loads(value)
+    if field == "is_active":
+        return value.lower() in ("true", "1")
+    if field in ("breaker_opened_at", "interval_minutes", "last_run"):
+        return int(value)
+    return value
+
+def import_document(row: Dict) -> Dict:
+    # Empty CSV cells and nulls fall back to the collection defaults
+    document = {k: v for k, v in row.items() if v is not None}
+    if "groups" in document:
+        document["groups"] = chat_ids(document["groups"])
+    return document
+
+def chunks(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
 class LocalDatabase:
     def __init__(self):
-        self.file = '/tmp/db.json'
+        self.file = LOCAL_DB_FILE
+        # Byte offsets of each user's records in DELIVERY_LOG_FILE, oldest first, and how
+        # far into the file they have been indexed
+        self.delivery_offsets = {}
+        self.delivery_indexed = 0
+        # Ledger entries by key, and how far into LEDGER_FILE they have been read
+        self.ledger = {}
+        self.ledger_read = 0
+        self.ledger_inode = None
         self._load()
 
     def _load(self):
         if not os.path.exists(self.file):
-            self.data = {"users": [], "schedules": []}
+            self.data = {"users": [], "schedules": [], "media_cache": {}, "chat_caps": {}}
+            self.data["counters"] = self._count()
             self._save()
         else:
             with open(self.file, 'r') as f:
                 self.data = json.load(f)
+            self.data.setdefault("media_cache", {})
+            self.data.setdefault("chat_caps", {})
+            # Schedules written before deterministic IDs carried a millisecond "id"
+            for schedule in self.data["schedules"]:
+                if "$id" not in schedule:
+                    schedule["$id"] = schedule_doc_id(schedule["user_phone"], int(schedule.pop("id", 0)))
+            if "counters" not in self.data:
+                # Files written before counters existed: count once, then keep them current
+                self.data["counters"] = self._count()
+                self._save()
+
+    def _count(self) -> Dict:
+        return {
+            "total_users": len(self.data["users"]),
+            "active_users": len([u for u in self.data["users"] if u.get("is_active", True)]),
+            "schedules": len(self.data["schedules"]),
+            "sends_per_day": {}
+        }
 
     def _save(self):
         with open(self.file, 'w') as f:
@@ -138,53 +569,388 @@ class LocalDatabase:
                 "role": role,
                 "is_active": True
             })
+            self.data["counters"]["total_users"] += 1
+            self.data["counters"]["active_users"] += 1
         self._save()
     
     def update_user_status(self, phone: str, is_active: bool):
         user = self.get_user(phone)
         if user:
+            if bool(user.get("is_active", True)) != bool(is_active):
+                self.data["counters"]["active_users"] += 1 if is_active else -1
+            user["is_active"] = is_active
+            self._save()
+            return True
+        return False
+
+    def update_user_statuses(self, updates: List[Tuple[str, bool]]) -> List[Dict]:
+        # All or nothing: applied in memory, then written with one save
+        results = []
+        for phone, is_active in updates:
+            user = self.get_user(phone)
+            if not user:
+                results.append({"status": "not_found"})
+                continue
+            if bool(user.get("is_active", True)) != bool(is_active):
+                self.data["counters"]["active_users"] += 1 if is_active else -1
             user["is_active"] = is_active
+            results.append({"status": "updated"})
+        self._save()
+        return results
+
+    def update_user_breaker(self, phone: str, state: str, opened_at: int = 0, reason: str = ""):
+        user = self.get_user(phone)
+        if user:
+            user["breaker_state"] = state
+            user["breaker_opened_at"] = opened_at
+            user["breaker_reason"] = reason
             self._save()
             return True
         return False
 
+    def save_cached_groups(self, phone: str, groups: List[Dict]) -> int:
+        # Returns the group list version; it only moves when the list actually changes
+        user = self.get_user(phone)
+        if not user:
+            return 0
+        if user.get("groups_cache") != groups:
+            user["groups_cache"] = groups
+            user["groups_version"] = user.get("groups_version", 0) + 1
+        user["groups_cached_at"] = int(time.time())
+        self._save()
+        return user["groups_version"]
+
     def get_all_users(self) -> List[Dict]:
         return self.data["users"]
 
-    def add_schedule(self, user_phone: str, message: str, groups: List[int], interval_minutes: int):
-        self.data["schedules"].append({
-            "id": str(int(time.time() * 1000)),
-            "user_phone": user_phone,
-            "message": message,
-            "groups": groups,
-            "interval_minutes": interval_minutes,
-            "last_run": 0
-        })
+    def get_tripped_users(self) -> List[Dict]:
+        return [u for u in self.data["users"] if u.get("breaker_state", "closed") != "closed"]
+
+    def list_users(self, limit: int, cursor: str = None, page: int = 1, search: str = None) -> Dict:
+        users = self.data["users"]
+        if search:
+            users = [u for u in users if u["phone"].startswith(search)]
+        # Cursor is the phone of the last user on the previous page
+        start = (max(page, 1) - 1) * limit
+        if cursor:
+            start = next((i + 1 for i, u in enumerate(users) if u["phone"] == cursor), len(users))
+        page_users = users[start:start + limit]
+        has_more = start + limit < len(users)
+        return {
+            "users": [project_user(u) for u in page_users],
+            "next_cursor": page_users[-1]["phone"] if has_more and page_users else None,
+            "total": len(users)
+        }
+
+    # Export cursors are the natural keys: phone for users, $id for schedules
+    def iter_users(self, fields: List[str], after: str = None) -> Iterator[Dict]:
+        yield from self._iter_rows(self.data["users"], "phone", fields, after)
+
+    def iter_schedules(self, fields: List[str], after: str = None) -> Iterator[Dict]:
+        yield from self._iter_rows(self.data["schedules"], "$id", fields, after)
+
+    @staticmethod
+    def _iter_rows(documents: List[Dict], key: str, fields: List[str], after: str = None) -> Iterator[Dict]:
+        start = next((i + 1 for i, d in enumerate(documents) if d[key] == after), len(documents)) if after else 0
+        for document in itertools.islice(documents, start, None):
+            yield {f: document.get(f) for f in fields}
+
+    def import_users(self, rows: Iterable[Dict]) -> int:
+        # Upserts by phone with one save for the whole import. Rows without a session string
+        # are skipped: the account could never be scheduled
+        users = {u["phone"]: u for u in self.data["users"]}
+        imported = 0
+        for row in rows:
+            if not row.get("session_string"):
+                continue
+            document = import_document(row)
+            if document["phone"] in users:
+                users[document["phone"]].update(document)
+            else:
+                user = {"role": "subscriber", "is_active": True, **document}
+                users[user["phone"]] = user
+                self.data["users"].append(user)
+            imported += 1
+        self._recount()
+        self._save()
+        return imported
+
+    def import_schedules(self, rows: Iterable[Dict]) -> int:
+        # Upserts by $id with one save; owners get one schedules_version bump each
+        schedules = {s["$id"]: s for s in self.data["schedules"]}
+        created_ms = int(time.time() * 1000)
+        owners = set()
+        imported = 0
+        for seq, row in enumerate(rows):
+            document = {"last_run": 0, **import_document(row)}
+            document["$id"] = document.get("$id") or schedule_doc_id(document["user_phone"], created_ms, seq)
+            if document["$id"] in schedules:
+                schedules[document["$id"]].update(document)
+            else:
+                schedules[document["$id"]] = document
+                self.data["schedules"].append(document)
+            owners.add(document["user_phone"])
+            imported += 1
+        for user in self.data["users"]:
+            if user["phone"] in owners:
+                user["schedules_version"] = user.get("schedules_version", 0) + 1
+        self._recount()
+        self._save()
+        return imported
+
+    def _recount(self):
+        self.data["counters"] = {**self._count(), "sends_per_day": self.data["counters"].get("sends_per_day", {})}
+
+    def add_schedule(self, user_phone: str, message: str, groups: List[int], interval_minutes: int, media: Optional[Dict] = None):
+        schedule = {
+            "$id": schedule_doc_id(user_phone, int(time.time() * 1000)),
+            **schedule_document(user_phone, message, groups, interval_minutes, media)
+        }
+        self.data["schedules"].append(schedule)
+        self.data["counters"]["schedules"] += 1
+        user = self.get_user(user_phone)
+        if user:
+            user["schedules_version"] = user.get("schedules_version", 0) + 1
         self._save()
 
+    def add_schedules(self, user_phone: str, schedules: List[Dict]) -> List[Dict]:
+        # All or nothing: one save for the batch, one schedules_version bump
+        created_ms = int(time.time() * 1000)
+        results = []
+        for seq, item in enumerate(schedules):
+            schedule = {
+                "$id": schedule_doc_id(user_phone, created_ms, seq),
+                **schedule_document(user_phone, item["message"], item["groups"], item["interval_minutes"], item.get("media"))
+            }
+            self.data["schedules"].append(schedule)
+            results.append({"status": "created", "id": schedule["$id"]})
+        self.data["counters"]["schedules"] += len(schedules)
+        user = self.get_user(user_phone)
+        if user:
+            user["schedules_version"] = user.get("schedules_version", 0) + 1
+        self._save()
+        return results
+
     def get_user_schedules(self, user_phone: str) -> List[Dict]:
         return [s for s in self.data["schedules"] if s["user_phone"] == user_phone]
 
-    def get_due_schedules(self) -> List[Dict]:
-        now = time.time()
+    def get_due_schedules(self, within: int = 0) -> List[ScheduleRecord]:
+        # Due now, or within the next `within` seconds
+        until = time.time() + within
+        inactive = {u["phone"] for u in self.data["users"] if not u.get("is_active", True)}
         due = []
         for schedule in self.data["schedules"]:
-            if now - schedule["last_run"] >= schedule["interval_minutes"] * 60:
-                due.append(schedule)
+            if schedule["user_phone"] in inactive:
+                continue
+            try:
+                if schedule_due_at(schedule) <= until:
+                    due.append(ScheduleRecord.from_document(schedule))
+            except (KeyError, TypeError, ValueError) as e:
+                # One malformed schedule must not stop everyone else's
+                logger.warning("Skipping malformed schedule %s: %s", schedule.get("$id"), e)
         return due
 
     def update_last_run(self, schedule_id: str):
         for schedule in self.data["schedules"]:
-            if schedule["id"] == schedule_id:
+            if schedule["$id"] == schedule_id:
                 schedule["last_run"] = time.time()
                 break
         self._save()
 
+    def bulk_update_last_run(self, schedule_ids: List[str], last_run: int):
+        # One file write for the whole batch
+        ids = set(schedule_ids)
+        for schedule in self.data["schedules"]:
+            if schedule["$id"] in ids:
+                schedule["last_run"] = last_run
+        self._save()
+
+    def bulk_update_outcomes(self, outcomes: Dict[str, Dict[str, str]]):
+        # Replaces, like the Appwrite store: last_outcomes is the schedule's latest pass only
+        for schedule in self.data["schedules"]:
+            if schedule["$id"] in outcomes:
+                schedule["last_outcomes"] = dict(outcomes[schedule["$id"]])
+        self._save()
+
+    def append_deliveries(self, records: List[Dict]):
+        # Appended to a separate log file, so history never makes the main file rewrite grow
+        with open(DELIVERY_LOG_FILE, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def _index_deliveries(self):
+        # Only the records appended since the last call are parsed, so the log is read once
+        # in total rather than once per page
+        size = os.path.getsize(DELIVERY_LOG_FILE) if os.path.exists(DELIVERY_LOG_FILE) else 0
+        if size < self.delivery_indexed:
+            # Truncated or replaced; start over
+            self.delivery_offsets = {}
+            self.delivery_indexed = 0
+        if size == self.delivery_indexed:
+            return
+        offset = self.delivery_indexed
+        with open(DELIVERY_LOG_FILE, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A write still in progress; indexed on a later call
+                    break
+                phone = json.loads(line)["user_phone"]
+                self.delivery_offsets.setdefault(phone, array.array('q')).append(offset)
+                offset += len(line)
+        self.delivery_indexed = offset
+
+    def get_deliveries(self, user_phone: str, limit: int, cursor: str = None) -> Dict:
+        # Newest first; the cursor is how many of this user's records were already returned
+        self._index_deliveries()
+        offsets = self.delivery_offsets.get(user_phone, ())
+        start = int(cursor or 0)
+        if start < 0:
+            raise ValueError(f"invalid cursor: {cursor}")
+        end = max(len(offsets) - start, 0)
+        page = []
+        if end:
+            with open(DELIVERY_LOG_FILE, 'rb') as f:
+                for offset in reversed(offsets[max(end - limit, 0):end]):
+                    f.seek(offset)
+                    page.append(json.loads(f.readline()))
+        return {
+            "deliveries": page,
+            "next_cursor": str(start + limit) if start + limit < len(offsets) else None
+        }
+
+    def record_sends(self, count: int):
+        if count <= 0:
+            return
+        day = stats_days(1)[0]
+        sends = self.data["counters"]["sends_per_day"]
+        sends[day] = sends.get(day, 0) + count
+        # Only keep the window the stats endpoint reports
+        for old_day in set(sends) - set(stats_days()):
+            del sends[old_day]
+        self._save()
+
+    def get_stats(self) -> Dict:
+        counters = self.data["counters"]
+        return {
+            "total_users": counters["total_users"],
+            "active_users": counters["active_users"],
+            "schedules": counters["schedules"],
+            "sends_per_day": {day: counters["sends_per_day"].get(day, 0) for day in stats_days()}
+        }
+
+    def get_media_file_id(self, phone: str, source: str) -> Optional[str]:
+        return self.data["media_cache"].get(media_cache_key(phone, source))
+
+    def get_chat_caps(self, phone: str) -> Dict[str, Dict]:
+        return dict(self.data["chat_caps"].get(phone, {}))
+
+    def save_chat_caps(self, phone: str, entries: Dict[str, Dict]):
+        self.data["chat_caps"].setdefault(phone, {}).update(entries)
+        self._save()
+
+    @contextmanager
+    def _ledger_lock(self):
+        # Every ledger read-modify-write holds this lock, so claims from overlapping processes
+        # are serialized and compaction never drops a claim appended meanwhile
+        with open(LEDGER_FILE + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._read_ledger()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_ledger(self):
+        # Picks up entries appended since the last call, including other processes' ones
+        try:
+            stat = os.stat(LEDGER_FILE)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != self.ledger_inode or stat.st_size < self.ledger_read:
+            # New, or compacted by another process; read it again from the start
+            self.ledger = {}
+            self.ledger_read = 0
+            self.ledger_inode = stat.st_ino if stat else None
+        if stat is None or stat.st_size == self.ledger_read:
+            return
+        with open(LEDGER_FILE, 'rb') as f:
+            f.seek(self.ledger_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                self.ledger[entry.pop("key")] = entry
+                self.ledger_read += len(line)
+
+    def _append_ledger(self, key: str, entry: Dict):
+        # One line per state change, synced before the caller goes on to send
+        with open(LEDGER_FILE, 'a') as f:
+            f.write(json.dumps({"key": key, **entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.ledger[key] = entry
+
+    def claim_delivery(self, key: str, expires_at: int, lease_until: int) -> Tuple[str, Optional[str]]:
+        with self._ledger_lock():
+            now = time.time()
+            entry = self.ledger.get(key)
+            if entry and entry["expires_at"] > now:
+                # Entries written before claims had states were only made for sent chats
+                state = entry.get("state", "sent")
+                if state == "sent" or (state == "pending" and entry["lease_until"] > now):
+                    return state, None
+                # Released, or the pass holding it died mid-send: take it over
+                expires_at = entry["expires_at"]
+            self._append_ledger(key, {"state": "pending", "expires_at": expires_at, "lease_until": lease_until})
+        return "claimed", key
+
+    def _set_delivery_state(self, token: str, state: str):
+        with self._ledger_lock():
+            entry = self.ledger.get(token)
+            if entry:
+                self._append_ledger(token, {**entry, "state": state})
+
+    def complete_delivery(self, token: str):
+        self._set_delivery_state(token, "sent")
+
+    def release_delivery(self, token: str):
+        self._set_delivery_state(token, "released")
+
+    def prune_ledger(self) -> int:
+        # Once per pass: rewrite the file with only the live entries
+        with self._ledger_lock():
+            now = time.time()
+            live = {key: entry for key, entry in self.ledger.items() if entry["expires_at"] > now}
+            expired = len(self.ledger) - len(live)
+            if expired:
+                temp = LEDGER_FILE + ".tmp"
+                with open(temp, 'w') as f:
+                    for key, entry in live.items():
+                        f.write(json.dumps({"key": key, **entry}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp, LEDGER_FILE)
+                stat = os.stat(LEDGER_FILE)
+                self.ledger = live
+                self.ledger_read = stat.st_size
+                self.ledger_inode = stat.st_ino
+        return expired
+
+    def save_media_file_id(self, phone: str, source: str, file_id: str):
+        self.data["media_cache"][media_cache_key(phone, source)] = file_id
+        self._save()
+
+    def delete_media_file_id(self, phone: str, source: str):
+        if self.data["media_cache"].pop(media_cache_key(phone, source), None):
+            self._save()
+
 class AppwriteDatabase:
     def __init__(self):
         from appwrite.client import Client
         from appwrite.services.databases import Databases
         from appwrite.query import Query
+        from appwrite.exception import AppwriteException
         
         self.client = Client()
         self.client.set_endpoint(APPWRITE_ENDPOINT)
@@ -192,54 +958,78 @@ class AppwriteDatabase:
         self.client.set_key(APPWRITE_API_KEY)
         self.databases = Databases(self.client)
         self.Query = Query
+        self.AppwriteException = AppwriteException
 
-    def get_user(self, phone: str) -> Optional[Dict]:
+    def _update_user(self, phone: str, data: Dict) -> bool:
+        # One call; a missing user shows up as a 404 instead of needing a lookup first
         try:
-            result = self.databases.list_documents(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                [self.Query.equal("phone", phone)]
-            )
-            if result['documents']:
-                return result['documents'][0]
+            self.databases.update_document(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(phone), data)
+            return True
+        except self.AppwriteException as e:
+            if e.code == 404:
+                return False
+            raise
+
+    def get_user(self, phone: str) -> Optional[Dict]:
+        if not phone:
             return None
-        except Exception as e:
-            print(f"Appwrite Error: {e}")
+        try:
+            return self.databases.get_document(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(phone))
+        except self.AppwriteException as e:
+            if e.code != 404:
+                logger.error("Appwrite error: %s", e)
             return None
 
     def save_user(self, phone: str, session_string: str, role: str = "subscriber"):
-        user = self.get_user(phone)
-        if user:
-            self.databases.update_document(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                user['$id'],
-                {"session_string": session_string}
-            )
-        else:
-            self.databases.create_document(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                'unique()',
-                {
-                    "phone": phone,
-                    "session_string": session_string,
-                    "role": role,
-                    "is_active": True
-                }
-            )
+        # Not upsert_document: that would reset role/is_active on existing accounts.
+        # Returning users (the common case) take a single update call.
+        if self._update_user(phone, {"session_string": session_string}):
+            return
+        self.databases.create_document(
+            DATABASE_ID,
+            USERS_COLLECTION_ID,
+            user_doc_id(phone),
+            {
+                "phone": phone,
+                "session_string": session_string,
+                "role": role,
+                "is_active": True
+            }
+        )
 
     def update_user_status(self, phone: str, is_active: bool):
+        return self._update_user(phone, {"is_active": is_active})
+
+    def update_user_statuses(self, updates: List[Tuple[str, bool]]) -> List[Dict]:
+        # Independent documents; issue the updates concurrently and report each one
+        def update(item):
+            phone, is_active = item
+            try:
+                return {"status": "updated" if self._update_user(phone, {"is_active": is_active}) else "not_found"}
+            except self.AppwriteException as e:
+                return {"status": "error", "message": str(e)}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return list(pool.map(update, updates))
+
+    def update_user_breaker(self, phone: str, state: str, opened_at: int = 0, reason: str = ""):
+        return self._update_user(phone, {
+            "breaker_state": state,
+            "breaker_opened_at": opened_at,
+            "breaker_reason": reason
+        })
+
+    def save_cached_groups(self, phone: str, groups: List[Dict]) -> int:
         user = self.get_user(phone)
-        if user:
-            self.databases.update_document(
-                DATABASE_ID,
-                USERS_COLLECTION_ID,
-                user['$id'],
-                {"is_active": is_active}
-            )
-            return True
-        return False
+        if not user:
+            return 0
+        data = {"groups_cached_at": int(time.time())}
+        version = user.get("groups_version") or 0
+        if cached_groups(user) != groups:
+            version += 1
+            data["groups_cache"] = json.dumps(groups)
+            data["groups_version"] = version
+        self._update_user(phone, data)
+        return version
 
     def get_all_users(self) -> List[Dict]:
         try:
@@ -248,19 +1038,137 @@ class AppwriteDatabase:
         except:
             return []
 
-    def add_schedule(self, user_phone: str, message: str, groups: List[int], interval_minutes: int):
+    def get_tripped_users(self) -> List[Dict]:
+        try:
+            result = self.databases.list_documents(
+                DATABASE_ID,
+                USERS_COLLECTION_ID,
+                [
+                    self.Query.not_equal("breaker_state", "closed"),
+                    self.Query.select(["phone", "is_active", "breaker_state", "breaker_opened_at", "breaker_reason"])
+                ]
+            )
+            return result['documents']
+        except Exception as e:
+            logger.error("Appwrite error: %s", e)
+            return []
+
+    def list_users(self, limit: int, cursor: str = None, page: int = 1, search: str = None) -> Dict:
+        queries = [self.Query.select(USER_LIST_FIELDS + ["$id"]), self.Query.limit(limit)]
+        if search:
+            queries.append(self.Query.starts_with("phone", search))
+        if cursor:
+            queries.append(self.Query.cursor_after(cursor))
+        elif page > 1:
+            queries.append(self.Query.offset((page - 1) * limit))
+        result = self.databases.list_documents(DATABASE_ID, USERS_COLLECTION_ID, queries)
+        documents = result['documents']
+        return {
+            "users": [project_user(u) for u in documents],
+            # Appwrite cursors are document IDs
+            "next_cursor": documents[-1]['$id'] if len(documents) == limit else None,
+            "total": result['total']
+        }
+
+    # Export cursors are the natural keys: phone for users, $id for schedules
+    def iter_users(self, fields: List[str], after: str = None) -> Iterator[Dict]:
+        yield from self._iter_documents(USERS_COLLECTION_ID, fields, user_doc_id(after) if after else None)
+
+    def iter_schedules(self, fields: List[str], after: str = None) -> Iterator[Dict]:
+        yield from self._iter_documents(SCHEDULES_COLLECTION_ID, fields, after)
+
+    def _iter_documents(self, collection_id: str, fields: List[str], cursor: str = None) -> Iterator[Dict]:
+        # One page in memory at a time, however large the collection
+        select = list(dict.fromkeys(fields + ["$id"]))
+        while True:
+            queries = [self.Query.select(select), self.Query.limit(EXPORT_PAGE_SIZE)]
+            if cursor:
+                queries.append(self.Query.cursor_after(cursor))
+            documents = self.databases.list_documents(DATABASE_ID, collection_id, queries)['documents']
+            for document in documents:
+                yield {f: document.get(f) for f in fields}
+            if len(documents) < EXPORT_PAGE_SIZE:
+                return
+            cursor = documents[-1]['$id']
+
+    def import_users(self, rows: Iterable[Dict]) -> int:
+        # Rows without a session string are skipped: the account could never be scheduled
+        documents = (
+            {"$id": user_doc_id(row["phone"]), **import_document(row)}
+            for row in rows if row.get("session_string")
+        )
+        return self._upsert_all(USERS_COLLECTION_ID, documents)
+
+    def import_schedules(self, rows: Iterable[Dict]) -> int:
+        created_ms = int(time.time() * 1000)
+        owners = set()
+        def documents():
+            for seq, row in enumerate(rows):
+                document = import_document(row)
+                document["$id"] = document.get("$id") or schedule_doc_id(document["user_phone"], created_ms, seq)
+                owners.add(document["user_phone"])
+                yield document
+        imported = self._upsert_all(SCHEDULES_COLLECTION_ID, documents())
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(self._bump_schedules_version, owners))
+        return imported
+
+    def _upsert_all(self, collection_id: str, documents: Iterable[Dict]) -> int:
+        imported = 0
+        for chunk in chunks(documents, APPWRITE_BATCH_SIZE):
+            self.databases.upsert_documents(DATABASE_ID, collection_id, chunk)
+            imported += len(chunk)
+        return imported
+
+    def _get_inactive_phones(self) -> set:
+        result = self.databases.list_documents(
+            DATABASE_ID,
+            USERS_COLLECTION_ID,
+            [
+                self.Query.equal("is_active", [False]),
+                self.Query.select(["phone"]),
+                self.Query.limit(5000)
+            ]
+        )
+        return {u['phone'] for u in result['documents']}
+
+    def add_schedule(self, user_phone: str, message: str, groups: List[int], interval_minutes: int, media: Optional[Dict] = None):
         self.databases.create_document(
             DATABASE_ID,
             SCHEDULES_COLLECTION_ID,
-            'unique()',
-            {
-                "user_phone": user_phone,
-                "message": message,
-                "groups": groups, 
-                "interval_minutes": interval_minutes,
-                "last_run": 0
-            }
+            schedule_doc_id(user_phone, int(time.time() * 1000)),
+            schedule_document(user_phone, message, groups, interval_minutes, media)
         )
+        self._bump_schedules_version(user_phone)
+
+    def add_schedules(self, user_phone: str, schedules: List[Dict]) -> List[Dict]:
+        # Concurrent creates with a result per item; a failed item does not undo the others
+        created_ms = int(time.time() * 1000)
+        def create(indexed):
+            seq, item = indexed
+            doc_id = schedule_doc_id(user_phone, created_ms, seq)
+            try:
+                self.databases.create_document(
+                    DATABASE_ID,
+                    SCHEDULES_COLLECTION_ID,
+                    doc_id,
+                    schedule_document(user_phone, item["message"], item["groups"], item["interval_minutes"], item.get("media"))
+                )
+                return {"status": "created", "id": doc_id}
+            except self.AppwriteException as e:
+                return {"status": "error", "message": str(e)}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(create, enumerate(schedules)))
+        if any(result["status"] == "created" for result in results):
+            self._bump_schedules_version(user_phone)
+        return results
+
+    def _bump_schedules_version(self, user_phone: str):
+        try:
+            self.databases.increment_document_attribute(DATABASE_ID, USERS_COLLECTION_ID, user_doc_id(user_phone), "schedules_version", 1)
+        except self.AppwriteException as e:
+            if e.code != 404:
+                raise
 
     def get_user_schedules(self, user_phone: str) -> List[Dict]:
         try:
@@ -273,21 +1181,25 @@ class AppwriteDatabase:
         except:
             return []
 
-    def get_due_schedules(self) -> List[Dict]:
+    def get_due_schedules(self, within: int = 0) -> List[ScheduleRecord]:
         try:
-            result = self.databases.list_documents(DATABASE_ID, SCHEDULES_COLLECTION_ID)
-            all_schedules = result['documents']
-            
-            now = time.time()
+            inactive = self._get_inactive_phones()
+            until = time.time() + within
             due = []
-            for schedule in all_schedules:
-                last_run = schedule.get("last_run", 0)
-                interval = schedule.get("interval_minutes", 10)
-                if now - last_run >= interval * 60:
-                    due.append(schedule)
+            # Every page, not just the first, with only the fields the scheduler reads;
+            # one page of documents is alive at a time
+            for schedule in self._iter_documents(SCHEDULES_COLLECTION_ID, ScheduleRecord.FIELDS):
+                if schedule.get("user_phone") in inactive:
+                    continue
+                try:
+                    if schedule_due_at(schedule) <= until:
+                        due.append(ScheduleRecord.from_document(schedule))
+                except (KeyError, TypeError, ValueError) as e:
+                    # One malformed schedule must not stop everyone else's
+                    logger.warning("Skipping malformed schedule %s: %s", schedule.get("$id"), e)
             return due
         except Exception as e:
-            print(f"Error fetching schedules: {e}")
+            logger.error("Error fetching schedules: %s", e)
             return []
 
     def update_last_run(self, schedule_id: str):
@@ -298,33 +1210,666 @@ class AppwriteDatabase:
             {"last_run": int(time.time())}
         )
 
+    def bulk_update_last_run(self, schedule_ids: List[str], last_run: int):
+        # Same value for every schedule, so one update_documents call per batch of IDs
+        for i in range(0, len(schedule_ids), APPWRITE_BATCH_SIZE):
+            self.databases.update_documents(
+                DATABASE_ID,
+                SCHEDULES_COLLECTION_ID,
+                {"last_run": last_run},
+                [self.Query.equal("$id", schedule_ids[i:i + APPWRITE_BATCH_SIZE]), self.Query.limit(APPWRITE_BATCH_SIZE)]
+            )
+
+    def bulk_update_outcomes(self, outcomes: Dict[str, Dict[str, str]]):
+        # Values differ per schedule; issue the updates concurrently rather than one after another
+        def update(schedule_id):
+            self.databases.update_document(
+                DATABASE_ID,
+                SCHEDULES_COLLECTION_ID,
+                schedule_id,
+                {"last_outcomes": json.dumps(outcomes[schedule_id])}
+            )
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(update, outcomes))
+
+    def append_deliveries(self, records: List[Dict]):
+        for i in range(0, len(records), APPWRITE_BATCH_SIZE):
+            self.databases.create_documents(
+                DATABASE_ID,
+                DELIVERIES_COLLECTION_ID,
+                [{"$id": "unique()", **record, "chat_id": str(record["chat_id"])} for record in records[i:i + APPWRITE_BATCH_SIZE]]
+            )
+
+    def get_deliveries(self, user_phone: str, limit: int, cursor: str = None) -> Dict:
+        queries = [
+            self.Query.equal("user_phone", user_phone),
+            self.Query.order_desc("ts"),
+            self.Query.limit(limit)
+        ]
+        if cursor:
+            queries.append(self.Query.cursor_after(cursor))
+        documents = self.databases.list_documents(DATABASE_ID, DELIVERIES_COLLECTION_ID, queries)['documents']
+        return {
+            "deliveries": [{k: v for k, v in doc.items() if not k.startswith('$')} for doc in documents],
+            "next_cursor": documents[-1]['$id'] if len(documents) == limit else None
+        }
+
+    def _count(self, collection_id: str, queries: List = None) -> int:
+        # Appwrite computes `total` server-side; fetch a single ID-only document with it
+        result = self.databases.list_documents(
+            DATABASE_ID,
+            collection_id,
+            (queries or []) + [self.Query.select(["$id"]), self.Query.limit(1)]
+        )
+        return result['total']
+
+    def record_sends(self, count: int):
+        if count <= 0:
+            return
+        day = stats_days(1)[0]
+        document_id = f"sends-{day}"
+        try:
+            self.databases.increment_document_attribute(DATABASE_ID, COUNTERS_COLLECTION_ID, document_id, "count", count)
+            return
+        except self.AppwriteException as e:
+            if e.code != 404:
+                raise
+        # First send of the day creates the counter document; if another pass created it
+        # in the meantime, add to theirs instead of overwriting it
+        try:
+            self.databases.create_document(DATABASE_ID, COUNTERS_COLLECTION_ID, document_id, {"count": count})
+        except self.AppwriteException as e:
+            if e.code != 409:
+                raise
+            self.databases.increment_document_attribute(DATABASE_ID, COUNTERS_COLLECTION_ID, document_id, "count", count)
+
+    def get_stats(self) -> Dict:
+        days = stats_days()
+        result = self.databases.list_documents(
+            DATABASE_ID,
+            COUNTERS_COLLECTION_ID,
+            [self.Query.equal("$id", [f"sends-{day}" for day in days])]
+        )
+        sends = {doc['$id'][len("sends-"):]: doc.get('count', 0) for doc in result['documents']}
+        return {
+            "total_users": self._count(USERS_COLLECTION_ID),
+            "active_users": self._count(USERS_COLLECTION_ID, [self.Query.equal("is_active", [True])]),
+            "schedules": self._count(SCHEDULES_COLLECTION_ID),
+            "sends_per_day": {day: sends.get(day, 0) for day in days}
+        }
+
+    def get_chat_caps(self, phone: str) -> Dict[str, Dict]:
+        try:
+            result = self.databases.list_documents(
+                DATABASE_ID,
+                CHAT_CAPS_COLLECTION_ID,
+                [self.Query.equal("phone", phone), self.Query.limit(5000)]
+            )
+            return {doc['chat_id']: json.loads(doc['caps']) for doc in result['documents']}
+        except Exception as e:
+            logger.error("Appwrite error: %s", e)
+            return {}
+
+    def save_chat_caps(self, phone: str, entries: Dict[str, Dict]):
+        self.databases.upsert_documents(
+            DATABASE_ID,
+            CHAT_CAPS_COLLECTION_ID,
+            [
+                {"$id": chat_caps_key(phone, chat_id), "phone": phone, "chat_id": chat_id, "caps": json.dumps(entry)}
+                for chat_id, entry in entries.items()
+            ]
+        )
+
+    def claim_delivery(self, key: str, expires_at: int, lease_until: int) -> Tuple[str, Optional[str]]:
+        # create_document is the atomic test-and-set: a 409 means another pass got there first.
+        # Appwrite has no conditional update, so a claim that was released or whose holder died
+        # is never taken over in place; the next attempt's document is created instead, and only
+        # one pass can create it. All attempts of a key share the first one's expiry, so they
+        # are pruned together.
+        for attempt in range(LEDGER_MAX_ATTEMPTS):
+            document_id = f"{key[:33]}-{attempt}"
+            try:
+                self.databases.create_document(DATABASE_ID, LEDGER_COLLECTION_ID, document_id, {
+                    "expires_at": expires_at,
+                    "state": "pending",
+                    "lease_until": lease_until
+                })
+                return "claimed", document_id
+            except self.AppwriteException as e:
+                if e.code != 409:
+                    raise
+            try:
+                existing = self.databases.get_document(DATABASE_ID, LEDGER_COLLECTION_ID, document_id)
+            except self.AppwriteException as e:
+                if e.code != 404:
+                    raise
+                # Pruned in between; leave it to the next pass
+                return "pending", None
+            now = time.time()
+            if existing['expires_at'] <= now:
+                # The slot is over and waiting for prune_ledger; claiming now could race it
+                return "pending", None
+            state = existing.get('state') or "sent"
+            if state == "sent" or (state == "pending" and (existing.get('lease_until') or 0) > now):
+                return state, None
+            expires_at = existing['expires_at']
+        return "pending", None
+
+    def _set_delivery_state(self, token: str, state: str):
+        self.databases.update_document(DATABASE_ID, LEDGER_COLLECTION_ID, token, {"state": state})
+
+    def complete_delivery(self, token: str):
+        self._set_delivery_state(token, "sent")
+
+    def release_delivery(self, token: str):
+        self._set_delivery_state(token, "released")
+
+    def prune_ledger(self) -> int:
+        result = self.databases.delete_documents(
+            DATABASE_ID,
+            LEDGER_COLLECTION_ID,
+            [self.Query.less_than_equal("expires_at", int(time.time()))]
+        )
+        return result['total']
+
+    def get_media_file_id(self, phone: str, source: str) -> Optional[str]:
+        try:
+            document = self.databases.get_document(
+                DATABASE_ID,
+                MEDIA_CACHE_COLLECTION_ID,
+                media_cache_key(phone, source)
+            )
+            return document.get("file_id")
+        except Exception:
+            return None
+
+    def save_media_file_id(self, phone: str, source: str, file_id: str):
+        self.databases.upsert_document(
+            DATABASE_ID,
+            MEDIA_CACHE_COLLECTION_ID,
+            media_cache_key(phone, source),
+            {"phone": phone, "source": source, "file_id": file_id}
+        )
+
+    def delete_media_file_id(self, phone: str, source: str):
+        try:
+            self.databases.delete_document(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID, media_cache_key(phone, source))
+        except Exception as e:
+            logger.error("Appwrite error: %s", e)
+
 # Factory
 if os.environ.get("APPWRITE_ENDPOINT"):
     db = AppwriteDatabase()
 else:
     db = LocalDatabase()
 
+# --- Account Circuit Breaker ---
+
+class AccountBreaker:
+    # closed -> open when Telegram rejects the account (revoked session, deactivated, banned).
+    # open -> half_open once the cooldown has passed; the next send is the probe.
+    # half_open -> closed on a successful send, or back to open on another auth error.
+    # State lives on the user document so it survives between cron executions.
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, database, cooldown_seconds: int = BREAKER_COOLDOWN_SECONDS):
+        self.db = database
+        self.cooldown_seconds = cooldown_seconds
+
+    def state(self, user: UserRecord) -> str:
+        state = user.breaker_state or self.CLOSED
+        if state == self.OPEN and time.time() - user.breaker_opened_at >= self.cooldown_seconds:
+            return self.HALF_OPEN
+        return state
+
+    def allow(self, user: UserRecord) -> bool:
+        return self.state(user) != self.OPEN
+
+    def trips_on(self, error: Exception) -> bool:
+        # 401 errors: AUTH_KEY_UNREGISTERED, SESSION_REVOKED, USER_DEACTIVATED(_BAN), ...
+        return isinstance(error, Unauthorized)
+
+    def record_success(self, user: UserRecord):
+        if (user.breaker_state or self.CLOSED) == self.CLOSED:
+            return
+        self._set(user, self.CLOSED, 0, "")
+
+    def record_failure(self, user: UserRecord, error: Exception):
+        self._set(user, self.OPEN, int(time.time()), type(error).__name__)
+
+    def describe(self, user: UserRecord) -> Dict:
+        state = self.state(user)
+        opened_at = user.breaker_opened_at
+        return {
+            "phone": user.phone,
+            "is_active": user.is_active,
+            "state": state,
+            "reason": user.breaker_reason,
+            "opened_at": opened_at,
+            "retry_at": opened_at + self.cooldown_seconds if state != self.CLOSED else None
+        }
+
+    def _set(self, user: UserRecord, state: str, opened_at: int, reason: str):
+        self.db.update_user_breaker(user.phone, state, opened_at, reason)
+        user.breaker_state = state
+        user.breaker_opened_at = opened_at
+        user.breaker_reason = reason
+
+breaker = AccountBreaker(db)
+
+# --- Write-Behind Buffer ---
+
+class WriteBehindBuffer:
+    # Collects the scheduler's writes during a pass and sends them to the backend in bulk.
+    #
+    # Crash semantics: run marks (last_run) are queued with mark_run() once a schedule's sends
+    # are done, never ahead of them, and flushed together with delivery outcomes and delivery
+    # log records when WRITE_BUFFER_MAX_ITEMS entries or WRITE_BUFFER_MAX_AGE_SECONDS have
+    # accumulated, and at the end of the pass. A schedule therefore stays due until its run is
+    # really over: if a crash loses the mark, the next pass picks the schedule up again and the
+    # delivery ledger (DeliveryLedger), not the mark, decides which chats still need the message.
+    # A schedule with a chat still held by another pass gets no mark at all from this pass.
+    # Schedules picked up ahead of time are stamped with their due time, the rest with the
+    # start of the pass, so looking ahead never pulls the next run earlier.
+    def __init__(self, database, max_items: int = WRITE_BUFFER_MAX_ITEMS, max_age_seconds: int = WRITE_BUFFER_MAX_AGE_SECONDS):
+        self.db = database
+        self.max_items = max_items
+        self.max_age_seconds = max_age_seconds
+        self.runs = []
+        # last_outcomes holds one pass: every chat's outcome so far this pass, per schedule,
+        # and the schedules whose outcomes changed since the last flush
+        self.outcomes = {}
+        self.changed = set()
+        self.deliveries = []
+        self.pending = 0
+        self.oldest = None
+
+    def mark_run(self, schedule_id: str, last_run: float):
+        self.runs.append((schedule_id, int(last_run)))
+
+    def flush_runs(self):
+        if not self.runs:
+            return
+        # Schedules that were already due share the pass's start time, so this is one bulk
+        # write unless looking ahead
+        by_last_run = {}
+        for schedule_id, last_run in self.runs:
+            by_last_run.setdefault(last_run, []).append(schedule_id)
+        unwritten = []
+        for last_run, schedule_ids in by_last_run.items():
+            try:
+                self.db.bulk_update_last_run(schedule_ids, last_run)
+            except Exception as e:
+                # Kept for the next flush. Runs whose mark never gets written are picked up
+                # again next pass, and the delivery ledger skips the chats already sent.
+                logger.error("Failed to write run marks for %d schedules: %s", len(schedule_ids), e)
+                unwritten.extend((schedule_id, last_run) for schedule_id in schedule_ids)
+        self.runs = unwritten
+
+    def record(self, schedule: ScheduleRecord, chat_id, status: str, latency_ms: int = 0, error: Exception = None, detail: str = ""):
+        # status is one of "sent", "skipped", "failed"
+        error_class = type(error).__name__ if error else ""
+        self.outcomes.setdefault(schedule.id, {})[str(chat_id)] = f"{status}: {error_class or detail}" if status != "sent" else status
+        self.changed.add(schedule.id)
+        self.deliveries.append({
+            "schedule_id": schedule.id,
+            "user_phone": schedule.user_phone,
+            "chat_id": chat_id,
+            "status": status,
+            "latency_ms": latency_ms,
+            "error_class": error_class,
+            "ts": int(time.time())
+        })
+        self.pending += 1
+        if self.oldest is None:
+            self.oldest = time.time()
+        if self.pending >= self.max_items or time.time() - self.oldest >= self.max_age_seconds:
+            self.flush()
+
+    def flush_outcomes(self):
+        if not self.changed and not self.deliveries:
+            return
+        # Two independent writes, each cleared only once it succeeded; what failed is retried
+        # by the next flush. Neither may stop the pass.
+        if self.deliveries:
+            try:
+                self.db.append_deliveries(self.deliveries)
+                self.deliveries = []
+            except Exception as e:
+                logger.error("Failed to append %d delivery records: %s", len(self.deliveries), e)
+        if self.changed:
+            try:
+                # The whole pass so far, so a flush in the middle of a schedule never drops the
+                # chats written by the flush before it
+                self.db.bulk_update_outcomes({schedule_id: self.outcomes[schedule_id] for schedule_id in self.changed})
+                self.changed = set()
+            except Exception as e:
+                logger.error("Failed to write outcomes for %d schedules: %s", len(self.changed), e)
+        # Anything left waits for the next threshold rather than retrying on every record
+        self.pending = 0
+        self.oldest = time.time() if self.deliveries or self.changed else None
+
+    def flush(self):
+        self.flush_runs()
+        self.flush_outcomes()
+
+# --- Delivery Ledger ---
+
+class DeliveryLedger:
+    # One entry per (schedule, run slot, chat). A chat is claimed as "pending" right before the
+    # send and marked "sent" right after it succeeds; a failed send releases the claim.
+    #
+    #   sent     an earlier or overlapping pass delivered it; skipped
+    #   pending  another pass is sending it now; skipped, and the schedule's run mark is left
+    #            unwritten so that, should that pass have died, a later pass comes back for it
+    #            once the claim's lease (DELIVERY_CLAIM_LEASE_SECONDS) has run out
+    #
+    # So a pass that crashes is resumed exactly where it stopped: chats it sent are skipped, the
+    # one it was sending is retried after the lease, the rest are sent by the next pass. Only a
+    # crash between Telegram accepting a message and complete() can send that one chat twice.
+    #
+    # The run slot is the schedule's due time, which only moves once its run mark is written.
+    # Entries expire when the slot's interval is over and are pruned at the start of each pass.
+    def __init__(self, database, lease_seconds: int = DELIVERY_CLAIM_LEASE_SECONDS):
+        self.db = database
+        self.lease_seconds = lease_seconds
+
+    def claim(self, schedule: ScheduleRecord, chat_id) -> Tuple[str, Optional[str]]:
+        # ("claimed", token) when this pass should send; otherwise ("sent" | "pending", None)
+        slot = int(schedule.due_at)
+        now = int(time.time())
+        expires_at = max(slot, now) + schedule.interval_minutes * 60
+        return self.db.claim_delivery(delivery_key(schedule.id, slot, chat_id), expires_at, now + self.lease_seconds)
+
+    def complete(self, token: str):
+        try:
+            self.db.complete_delivery(token)
+        except Exception as e:
+            # Still pending: once the lease runs out a later pass sends it again
+            logger.error("Failed to mark delivery %s as sent: %s", token, e)
+
+    def release(self, token: str):
+        try:
+            self.db.release_delivery(token)
+        except Exception as e:
+            # Still pending: retried once the lease runs out
+            logger.warning("Failed to release delivery %s: %s", token, e)
+
+    def prune(self):
+        try:
+            self.db.prune_ledger()
+        except Exception as e:
+            # Expired entries are ignored by claim() anyway; they just take space
+            logger.warning("Failed to prune delivery ledger: %s", e)
+
+# --- Chat Capabilities ---
+
+# Errors meaning the account cannot post in that chat at all (kicked, read-only, private, ...)
+CHAT_BLOCKED_ERRORS = (ChatWriteForbidden, ChatRestricted, ChatAdminRequired, ChannelPrivate, UserBannedInChannel, UserNotParticipant)
+
+class ChatCapabilityCache:
+    # Per (account, chat) record of whether a send can succeed, so the scheduler skips
+    # chats it can no longer post in and holds chats still inside their slow-mode window
+    # instead of failing the send every interval. Entries are re-checked after
+    # CHAT_CAPS_TTL_SECONDS, or on the next pass after an unexpected send error.
+    def __init__(self, database, ttl_seconds: int = CHAT_CAPS_TTL_SECONDS):
+        self.db = database
+        self.ttl_seconds = ttl_seconds
+        self.entries = {}
+        self.dirty = {}
+
+    def _entries(self, phone: str) -> Dict[str, Dict]:
+        if phone not in self.entries:
+            self.entries[phone] = self.db.get_chat_caps(phone)
+        return self.entries[phone]
+
+    def _store(self, phone: str, chat_id, entry: Dict):
+        self._entries(phone)[str(chat_id)] = entry
+        self.dirty.setdefault(phone, set()).add(str(chat_id))
+
+    async def check(self, bot: TelegramBot, phone: str, chat_id, needs_media: bool = False) -> Optional[str]:
+        # Returns why the send should be skipped, or None to go ahead
+        now = time.time()
+        entry = self._entries(phone).get(str(chat_id))
+        if not entry or now - entry.get("checked_at", 0) >= self.ttl_seconds:
+            try:
+                fresh = await bot.get_chat_capabilities(chat_id)
+            except CHAT_BLOCKED_ERRORS as e:
+                fresh = {"can_send": False, "can_send_media": False, "slow_mode_delay": 0, "reason": type(e).__name__}
+            except Unauthorized:
+                raise
+            except Exception:
+                # Could not tell (flood wait, network); let the send decide
+                return None
+            fresh["checked_at"] = int(now)
+            fresh["hold_until"] = entry.get("hold_until", 0) if entry else 0
+            entry = fresh
+            self._store(phone, chat_id, entry)
+
+        if not entry["can_send"]:
+            return f"cannot post ({entry.get('reason') or 'no permission'})"
+        if needs_media and not entry.get("can_send_media", True):
+            return "cannot post media"
+        if entry.get("hold_until", 0) > now:
+            return f"slow mode for {int(entry['hold_until'] - now)}s"
+        return None
+
+    def record_sent(self, phone: str, chat_id):
+        entry = self._entries(phone).get(str(chat_id))
+        if entry and entry.get("slow_mode_delay"):
+            entry["hold_until"] = int(time.time()) + entry["slow_mode_delay"]
+            self._store(phone, chat_id, entry)
+
+    def record_error(self, phone: str, chat_id, error: Exception):
+        if isinstance(error, Unauthorized):
+            # An account problem, not a chat one; the breaker handles it
+            return
+        now = int(time.time())
+        entry = dict(self._entries(phone).get(str(chat_id)) or {"can_send": True, "can_send_media": True, "slow_mode_delay": 0})
+        entry["checked_at"] = now
+        if isinstance(error, SlowmodeWait):
+            entry["hold_until"] = now + error.value
+            entry["slow_mode_delay"] = max(entry.get("slow_mode_delay", 0), error.value)
+        elif isinstance(error, ChatSendMediaForbidden):
+            entry["can_send_media"] = False
+        elif isinstance(error, CHAT_BLOCKED_ERRORS):
+            entry["can_send"] = False
+            entry["reason"] = type(error).__name__
+        else:
+            # Unknown failure: re-check the chat before the next attempt
+            entry["checked_at"] = 0
+        self._store(phone, chat_id, entry)
+
+    def flush(self):
+        for phone, chat_ids in self.dirty.items():
+            entries = self._entries(phone)
+            try:
+                self.db.save_chat_caps(phone, {chat_id: entries[chat_id] for chat_id in chat_ids})
+            except Exception as e:
+                logger.warning("Failed to save chat capabilities for %s: %s", phone, e)
+        self.dirty = {}
+
+# --- Media Delivery ---
+
+MEDIA_TYPES = ("photo", "document")
+# Raised when a cached file_id can no longer be used and the URL has to be sent again
+MEDIA_EXPIRED_ERRORS = (FileReferenceExpired, FileReferenceInvalid, MediaEmpty)
+
+class MediaSender:
+    # Sends a schedule's attachment by URL at most once per account; every later send,
+    # to any group and on any run, reuses the file_id Telegram returned. Telegram fetches
+    # the URL itself, so user-supplied URLs are never requested from this server.
+    def __init__(self, database):
+        self.db = database
+        self.file_ids = {}
+
+    async def send(self, bot: TelegramBot, phone: str, schedule: ScheduleRecord, chat_id: int):
+        media_type = schedule.media_type
+        source = schedule.media_url
+        caption = schedule.message or None
+        key = (phone, source)
+
+        if key not in self.file_ids:
+            self.file_ids[key] = self.db.get_media_file_id(phone, source)
+        file_id = self.file_ids[key]
+        if file_id:
+            try:
+                await bot.send_media(chat_id, media_type, file_id, caption)
+                return
+            except MEDIA_EXPIRED_ERRORS:
+                self.db.delete_media_file_id(phone, source)
+
+        file_id = await bot.send_media(chat_id, media_type, source, caption)
+        self.file_ids[key] = file_id
+        self.db.save_media_file_id(phone, source, file_id)
+
+# --- Connection Pre-warming ---
+
+class ClientPool:
+    # One Telegram connection per account for a scheduler pass. warm() opens the connections of
+    # the accounts due soonest, concurrently and at most max_clients of them, so the connect and
+    # auth-key exchange happen before the first send instead of after the schedule fires. An
+    # account's connection is closed once its last schedule of the pass has run; close() tears
+    # down anything left, including warmed clients that were never used.
+    def __init__(self, max_clients: int = PREWARM_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self.bots = {}
+        # Schedules of this pass each account still has to run
+        self.pending = {}
+
+    async def warm(self, schedules: List[ScheduleRecord], users: Dict[str, UserRecord]) -> int:
+        # `schedules` is ordered by due time, so the cap keeps the clients needed first
+        for schedule in schedules:
+            phone = schedule.user_phone
+            self.pending[phone] = self.pending.get(phone, 0) + 1
+        phones = list(self.pending)[:self.max_clients]
+        results = await asyncio.gather(
+            *(self._connect(phone, users[phone].session_string) for phone in phones),
+            return_exceptions=True
+        )
+        warmed = 0
+        for phone, result in zip(phones, results):
+            if isinstance(result, Exception):
+                # acquire() will try again when the schedule fires
+                logger.warning("Failed to pre-warm client for %s: %s", phone, result)
+            else:
+                warmed += 1
+        return warmed
+
+    async def _connect(self, phone: str, session_string: str) -> TelegramBot:
+        bot = TelegramBot(session_string)
+        await bot.connect()
+        self.bots[phone] = bot
+        return bot
+
+    async def acquire(self, phone: str, session_string: str) -> TelegramBot:
+        bot = self.bots.get(phone)
+        if bot and bot.is_connected:
+            return bot
+        return await self._connect(phone, session_string)
+
+    async def release(self, phone: str):
+        self.pending[phone] = self.pending.get(phone, 1) - 1
+        if self.pending[phone] <= 0:
+            await self.close_client(phone)
+
+    async def close_client(self, phone: str):
+        bot = self.bots.pop(phone, None)
+        if bot:
+            try:
+                await bot.disconnect()
+            except Exception as e:
+                logger.warning("Failed to disconnect client for %s: %s", phone, e)
+
+    async def close(self):
+        for phone in list(self.bots):
+            await self.close_client(phone)
+
 # --- Main Function Logic ---
 
 def get_json(context):
     try:
-        print(f"DEBUG: Raw Body Type: {type(context.req.body)}")
-        print(f"DEBUG: Raw Body: {context.req.body}")
-        
         if isinstance(context.req.body, dict):
             return context.req.body
             
         return json.loads(context.req.body)
     except Exception as e:
-        print(f"DEBUG: JSON Parse Error: {e}")
+        logger.debug("JSON parse error: %s", e)
         return {}
 
+# Body fields holding Telegram credentials and login codes; recorded as stable placeholders instead
+SECRET_FIELDS = ("session_string", "partial_session", "code", "phone_code_hash")
+
+def record_request(context):
+    body = context.req.body
+    if isinstance(body, str):
+        try:
+            body = json.loads(body) if body else {}
+        except ValueError:
+            body = {}
+    if isinstance(body, dict):
+        body = {
+            k: "redacted-" + hashlib.sha1(str(v).encode()).hexdigest()[:12] if k in SECRET_FIELDS and v else v
+            for k, v in body.items()
+        }
+    req_headers = getattr(context.req, 'headers', None) or {}
+    with open(RECORD_TRAFFIC_FILE, 'a') as f:
+        f.write(json.dumps({
+            "method": context.req.method,
+            "path": context.req.path,
+            "headers": {k: v for k, v in req_headers.items() if k in ('content-type', 'if-none-match')},
+            "body": body
+        }) + "\n")
+
+# --- Profiling (Embedded, mirrors profiling.py) ---
+
+# cProfile hooks the whole interpreter thread, so only one request is profiled at a time; with
+# concurrent executions the profile also includes whatever else ran on the loop meanwhile
+_profiling = threading.Lock()
+
+def should_profile(headers) -> bool:
+    if not PROFILE_DIR:
+        return False
+    if str(headers.get(PROFILE_HEADER, "")).strip() == "1":
+        return True
+    return random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile() -> Optional[cProfile.Profile]:
+    if not _profiling.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profile(profiler: cProfile.Profile, method: str, path: str):
+    profiler.disable()
+    _profiling.release()
+    route = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{method.lower()}_{route}-{time.time_ns()}.prof"))
+    except OSError as e:
+        logger.warning("Failed to write profile for %s %s: %s", method, path, e)
+
+def make_etag(kind: str, phone: str, version: int) -> str:
+    # Versions are per user but start from the same numbers for everyone, so the token also
+    # names its owner; one user's token never matches another user's data
+    return f'"{kind}-{user_doc_id(phone or "")[1:13]}-{version or 0}"'
+
+def not_modified(context, data: Dict, etag: str) -> bool:
+    # Clients send the token back either as If-None-Match or as `version` in the body
+    req_headers = getattr(context.req, 'headers', None) or {}
+    presented = req_headers.get('if-none-match') or data.get('version')
+    return presented == etag
+
 async def main(context):
-    print(f"DEBUG: Execution started. API_ID={API_ID}, API_HASH={API_HASH}")
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag, X-Next-Cursor'
     }
 
     if context.req.method == 'OPTIONS':
@@ -333,8 +1878,22 @@ async def main(context):
     path = context.req.path
     method = context.req.method
 
-    print(f"Request: {method} {path}")
+    logger.info("%s %s", method, path, extra={'sample_rate': LOG_REQUEST_SAMPLE_RATE})
+    if RECORD_TRAFFIC_FILE:
+        try:
+            record_request(context)
+        except Exception as e:
+            logger.warning("Failed to record request: %s", e)
+
+    profiler = start_profile() if PROFILE_DIR and should_profile(getattr(context.req, 'headers', None) or {}) else None
+    if not profiler:
+        return await route(context, path, method, headers)
+    try:
+        return await route(context, path, method, headers)
+    finally:
+        stop_profile(profiler, method, path)
 
+async def route(context, path, method, headers):
     try:
         if path == '/cron' or path == '/':
             return await run_scheduler(context, headers)
@@ -348,12 +1907,22 @@ async def main(context):
             return handle_create_schedule(context, headers)
         if path == '/schedules' and method == 'POST':
             return handle_get_schedules(context, headers)
+        if path == '/schedules/bulk' and method == 'POST':
+            return handle_create_schedules_bulk(context, headers)
+        if path == '/deliveries' and method == 'POST':
+            return handle_get_deliveries(context, headers)
         if path == '/admin/users' and method == 'POST':
             return handle_admin_get_users(context, headers)
         if path == '/admin/user_status' and method == 'POST':
             return handle_admin_update_status(context, headers)
+        if path == '/admin/user_status/bulk' and method == 'POST':
+            return handle_admin_update_status_bulk(context, headers)
         if path == '/admin/stats' and method == 'POST':
             return handle_admin_stats(context, headers)
+        if path == '/admin/breakers' and method == 'POST':
+            return handle_admin_breakers(context, headers)
+        if path == '/admin/export' and method == 'POST':
+            return handle_admin_export(context, headers)
 
         return context.res.json({'error': 'Not Found'}, 404, headers)
 
@@ -364,35 +1933,119 @@ async def main(context):
 # --- Handlers ---
 
 async def run_scheduler(context, headers):
-    print("Running Scheduler...")
-    due_schedules = db.get_due_schedules()
-    results = []
-    
+    logger.info("Running scheduler")
+    started = time.monotonic()
+    pass_started = time.time()
+    due_schedules = db.get_due_schedules(PREWARM_HORIZON_SECONDS)
+    # Per-delivery detail goes to the delivery log; the response only carries totals
+    summary = {'due': len(due_schedules), 'run': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0, 'accounts_skipped': 0, 'prewarmed': 0}
+    users = {}
+    media = MediaSender(db)
+    caps = ChatCapabilityCache(db)
+    writes = WriteBehindBuffer(db)
+    ledger = DeliveryLedger(db)
+    ledger.prune()
+
+    runnable = []
     for schedule in due_schedules:
-        user = db.get_user(schedule['user_phone'])
-        if not user or not user.get('session_string'):
+        phone = schedule.user_phone
+        if phone not in users:
+            document = db.get_user(phone)
+            users[phone] = UserRecord.from_document(document) if document else None
+        user = users[phone]
+        if not user or not user.session_string or not user.is_active:
+            continue
+        if not breaker.allow(user):
+            summary['accounts_skipped'] += 1
             continue
+        runnable.append(schedule)
 
-        bot = TelegramBot(user['session_string'])
-        for chat_id in schedule['groups']:
+    summary['run'] = len(runnable)
+    runnable.sort(key=lambda schedule: schedule.due_at)
+
+    # One connection per account for the whole pass, opened ahead of the first send
+    pool = ClientPool()
+    try:
+        summary['prewarmed'] = await pool.warm(runnable, users)
+        for schedule in runnable:
+            phone = schedule.user_phone
+            user = users[phone]
+            wait = schedule.due_at - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            # Set when another pass holds one of the chats; see DeliveryLedger
+            held = False
             try:
-                await bot.send_message(chat_id, schedule['message'])
-                results.append(f"Sent to {chat_id}")
+                if not breaker.allow(user):
+                    # Tripped by an earlier schedule of the same account in this pass
+                    continue
+                bot = await pool.acquire(phone, user.session_string)
+                for chat_id in schedule.groups:
+                    sent_at = time.monotonic()
+                    token = None
+                    try:
+                        skip = await caps.check(bot, phone, chat_id, bool(schedule.media_type))
+                        if skip:
+                            summary['skipped'] += 1
+                            writes.record(schedule, chat_id, "skipped", detail=skip)
+                            continue
+                        state, token = ledger.claim(schedule, chat_id)
+                        if state != "claimed":
+                            # Sent by an earlier pass that died before its run mark, or being sent by another
+                            summary['duplicates'] += 1
+                            held = held or state == "pending"
+                            continue
+                        if schedule.media_type:
+                            await media.send(bot, phone, schedule, chat_id)
+                        else:
+                            await bot.send_message(chat_id, schedule.message)
+                        ledger.complete(token)
+                        # Delivered; nothing below may release it
+                        token = None
+                        caps.record_sent(phone, chat_id)
+                        breaker.record_success(user)
+                        summary['sent'] += 1
+                        writes.record(schedule, chat_id, "sent", int((time.monotonic() - sent_at) * 1000))
+                    except Exception as e:
+                        if token:
+                            ledger.release(token)
+                        summary['failed'] += 1
+                        writes.record(schedule, chat_id, "failed", int((time.monotonic() - sent_at) * 1000), e)
+                        caps.record_error(phone, chat_id, e)
+                        if breaker.trips_on(e):
+                            # The account itself is dead; the remaining groups would fail the same way
+                            breaker.record_failure(user, e)
+                            await pool.close_client(phone)
+                            break
             except Exception as e:
-                results.append(f"Failed {chat_id}: {e}")
-        
-        db.update_last_run(schedule['$id'])
+                logger.error("Failed to run schedule %s for %s: %s", schedule.id, phone, e)
+                summary['failed'] += len(schedule.groups)
+            finally:
+                # Written with the outcomes, after the sends; see WriteBehindBuffer
+                if not held:
+                    writes.mark_run(schedule.id, max(schedule.due_at, pass_started))
+                await pool.release(phone)
+    finally:
+        await pool.close()
 
-    return context.res.json({'status': 'success', 'results': results}, 200, headers)
+    writes.flush()
+    caps.flush()
+    try:
+        db.record_sends(summary['sent'])
+    except Exception as e:
+        # The messages are out either way; a lost count must not fail the pass
+        logger.error("Failed to record %d sends: %s", summary['sent'], e)
+    summary['duration_ms'] = int((time.monotonic() - started) * 1000)
+    return context.res.json({'status': 'success', 'summary': summary}, 200, headers)
 
 async def handle_send_code(context, headers):
-    print(f"DEBUG: handle_send_code called. API_ID={API_ID}, API_HASH={API_HASH}")
     data = get_json(context)
     phone = data.get('phone')
     
     # Validate environment variables
     if not API_ID or not API_HASH:
-        print("DEBUG: Credentials missing!")
+        logger.error("API_ID or API_HASH not configured")
         return context.res.json({
             'status': 'error', 
             'message': 'API_ID or API_HASH not configured'
@@ -400,22 +2053,18 @@ async def handle_send_code(context, headers):
     
     bot = TelegramBot()
     try:
-        print(f"DEBUG: Attempting to send code to {phone}")
+        logger.debug("Sending code to %s", phone)
         phone_code_hash, partial_session = await bot.send_code(phone)
-        print(f"DEBUG: Code sent successfully. Hash: {phone_code_hash}")
         return context.res.json({
             'status': 'success', 
             'phone_code_hash': phone_code_hash,
             'partial_session': partial_session
         }, 200, headers)
     except Exception as e:
-        print(f"ERROR in handle_send_code: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("send_code failed for %s", phone)
         return context.res.json({'status': 'error', 'message': str(e)}, 500, headers)
 
 async def handle_verify_code(context, headers):
-    print("DEBUG: handle_verify_code called")
     try:
         data = get_json(context)
         phone = data.get('phone')
@@ -423,29 +2072,25 @@ async def handle_verify_code(context, headers):
         phone_code_hash = data.get('phone_code_hash')
         partial_session = data.get('partial_session')
         
-        print(f"DEBUG: Verifying code for {phone} with hash {phone_code_hash}")
-        print(f"DEBUG: Partial session present: {bool(partial_session)}")
+        logger.debug("Verifying code for %s (partial session: %s)", phone, bool(partial_session))
         
         bot = TelegramBot()
         session_string = await bot.verify_code(phone, phone_code_hash, code, partial_session)
         
-        print("DEBUG: Code verified, saving user...")
         db.save_user(phone, session_string)
         
         return context.res.json({'status': 'success', 'session_string': session_string, 'phone': phone}, 200, headers)
     except PhoneCodeExpired:
-        print("DEBUG: Code Expired")
+        logger.debug("Code expired for %s", phone)
         return context.res.json({'status': 'error', 'message': 'Code expired. Please request a new one.'}, 400, headers)
     except PhoneCodeInvalid as e:
-        print(f"DEBUG: Invalid code: {e}")
+        logger.debug("Invalid code for %s: %s", phone, e)
         return context.res.json({'status': 'error', 'message': 'Invalid code'}, 400, headers)
     except SessionPasswordNeeded:
-        print("DEBUG: 2FA Required")
+        logger.debug("2FA required for %s", phone)
         return context.res.json({'status': 'error', 'message': '2FA Required (Not supported)'}, 400, headers)
     except Exception as e:
-        print(f"ERROR in handle_verify_code: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("verify_code failed")
         return context.res.json({'status': 'error', 'message': str(e)}, 500, headers)
 
 async def handle_get_groups(context, headers):
@@ -455,25 +2100,120 @@ async def handle_get_groups(context, headers):
     if not session_string:
         return context.res.json({'error': 'Unauthorized'}, 401, headers)
 
+    # The cached list is only served to the account it belongs to
+    user = db.get_user(data.get('user_phone')) if data.get('user_phone') else None
+    owner = user if user and user.get('session_string') == session_string else None
+
+    if owner and not data.get('refresh'):
+        groups = cached_groups(owner)
+        fresh = time.time() - (owner.get('groups_cached_at') or 0) < GROUPS_CACHE_TTL_SECONDS
+        if groups is not None and fresh:
+            etag = make_etag('groups', owner['phone'], owner.get('groups_version'))
+            if not_modified(context, data, etag):
+                return context.res.send('', 304, {**headers, 'ETag': etag})
+            return context.res.json({'status': 'success', 'groups': groups, 'version': etag}, 200, {**headers, 'ETag': etag})
+
     bot = TelegramBot(session_string)
     groups = await bot.get_groups()
-    return context.res.json({'status': 'success', 'groups': groups}, 200, headers)
+    if not owner:
+        return context.res.json({'status': 'success', 'groups': groups}, 200, headers)
+
+    etag = make_etag('groups', owner['phone'], db.save_cached_groups(owner['phone'], groups))
+    if not_modified(context, data, etag):
+        return context.res.send('', 304, {**headers, 'ETag': etag})
+    return context.res.json({'status': 'success', 'groups': groups, 'version': etag}, 200, {**headers, 'ETag': etag})
+
+def parse_schedule(data: Dict) -> Dict:
+    # Shared by /schedule and /schedules/bulk; raises ValueError with a message for the client
+    if not isinstance(data, dict):
+        raise ValueError("schedule must be an object")
+    try:
+        interval = int(data.get('interval'))
+    except (TypeError, ValueError):
+        raise ValueError("interval must be an integer")
+    groups = data.get('groups')
+    if not isinstance(groups, list) or not all(type(chat_id) is int for chat_id in groups):
+        raise ValueError("groups must be a list of integer chat IDs")
+    media = data.get('media')
+    if media is not None and not isinstance(media, dict):
+        raise ValueError("media must be an object")
+    if media:
+        if media.get('type') not in MEDIA_TYPES:
+            raise ValueError(f"media.type must be one of {', '.join(MEDIA_TYPES)}")
+        if not str(media.get('url', '')).startswith(('http://', 'https://')):
+            raise ValueError("media.url must be an http(s) URL")
+    message = data.get('message')
+    if message is not None and not isinstance(message, str):
+        raise ValueError("message must be a string")
+    if not message and not media:
+        # Without media there is nothing else to send; with it, the message is the caption
+        raise ValueError("message is required unless media is attached")
+    return {'message': message, 'groups': groups, 'interval_minutes': interval, 'media': media}
 
 def handle_create_schedule(context, headers):
     data = get_json(context)
     user_phone = data.get('user_phone')
-    message = data.get('message')
-    groups = data.get('groups')
-    interval = int(data.get('interval'))
-    
-    db.add_schedule(user_phone, message, groups, interval)
+    try:
+        schedule = parse_schedule(data)
+    except ValueError as e:
+        return context.res.json({'status': 'error', 'message': str(e)}, 400, headers)
+
+    db.add_schedule(user_phone, schedule['message'], schedule['groups'], schedule['interval_minutes'], schedule['media'])
     return context.res.json({'status': 'success'}, 200, headers)
 
+def handle_create_schedules_bulk(context, headers):
+    data = get_json(context)
+    user_phone = data.get('user_phone')
+    if not user_phone:
+        return context.res.json({'error': 'Unauthorized'}, 401, headers)
+    items = data.get('schedules')
+    if not isinstance(items, list) or not items or len(items) > BULK_MAX_ITEMS:
+        return context.res.json({'status': 'error', 'message': f'schedules must be a list of 1 to {BULK_MAX_ITEMS} items'}, 400, headers)
+
+    # Validated together: one bad item rejects the whole request before anything is written
+    schedules, invalid = [], []
+    for index, item in enumerate(items):
+        try:
+            schedules.append(parse_schedule(item))
+        except ValueError as e:
+            invalid.append({'index': index, 'status': 'invalid', 'message': str(e)})
+    if invalid:
+        return context.res.json({'status': 'error', 'message': 'No schedules were created', 'results': invalid}, 400, headers)
+
+    results = [{'index': index, **result} for index, result in enumerate(db.add_schedules(user_phone, schedules))]
+    status = 'success' if all(result['status'] == 'created' for result in results) else 'partial'
+    return context.res.json({'status': status, 'results': results}, 200, headers)
+
 def handle_get_schedules(context, headers):
     data = get_json(context)
     user_phone = data.get('user_phone')
+    user = db.get_user(user_phone)
+    etag = make_etag('schedules', user_phone, user.get('schedules_version') if user else 0)
+    if not_modified(context, data, etag):
+        return context.res.send('', 304, {**headers, 'ETag': etag})
+
     schedules = db.get_user_schedules(user_phone)
-    return context.res.json({'status': 'success', 'schedules': schedules}, 200, headers)
+    return context.res.json({'status': 'success', 'schedules': schedules, 'version': etag}, 200, {**headers, 'ETag': etag})
+
+def handle_get_deliveries(context, headers):
+    data = get_json(context)
+    user_phone = data.get('user_phone')
+    if not user_phone:
+        return context.res.json({'error': 'Unauthorized'}, 401, headers)
+    try:
+        limit = min(max(int(data.get('limit') or DELIVERIES_PAGE_SIZE), 1), DELIVERIES_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return context.res.json({'status': 'error', 'message': 'limit must be an integer'}, 400, headers)
+
+    # Cursors are opaque to clients: a count on the local store, a document ID on Appwrite
+    cursor = data.get('cursor')
+    if cursor is not None and not (isinstance(cursor, str) and re.fullmatch(r'[A-Za-z0-9._-]{1,36}', cursor)):
+        return context.res.json({'status': 'error', 'message': 'cursor is not valid'}, 400, headers)
+    try:
+        history = db.get_deliveries(user_phone, limit, cursor)
+    except ValueError:
+        return context.res.json({'status': 'error', 'message': 'cursor is not valid'}, 400, headers)
+    return context.res.json({'status': 'success', **history}, 200, headers)
 
 def handle_admin_get_users(context, headers):
     data = get_json(context)
@@ -482,8 +2222,14 @@ def handle_admin_get_users(context, headers):
     if not user or user.get('role') != 'admin':
         return context.res.json({'error': 'Unauthorized'}, 403, headers)
     
-    users = db.get_all_users()
-    return context.res.json({'status': 'success', 'users': users}, 200, headers)
+    try:
+        limit = min(max(int(data.get('limit') or ADMIN_PAGE_SIZE), 1), ADMIN_MAX_PAGE_SIZE)
+        page = int(data.get('page') or 1)
+    except (TypeError, ValueError):
+        return context.res.json({'status': 'error', 'message': 'limit and page must be integers'}, 400, headers)
+
+    listing = db.list_users(limit, data.get('cursor'), page, (data.get('search') or '').strip() or None)
+    return context.res.json({'status': 'success', **listing}, 200, headers)
 
 def handle_admin_update_status(context, headers):
     data = get_json(context)
@@ -498,6 +2244,31 @@ def handle_admin_update_status(context, headers):
     db.update_user_status(target_phone, is_active)
     return context.res.json({'status': 'success'}, 200, headers)
 
+def handle_admin_update_status_bulk(context, headers):
+    data = get_json(context)
+    user = db.get_user(data.get('user_phone'))
+    if not user or user.get('role') != 'admin':
+        return context.res.json({'error': 'Unauthorized'}, 403, headers)
+    items = data.get('updates')
+    if not isinstance(items, list) or not items or len(items) > BULK_MAX_ITEMS:
+        return context.res.json({'status': 'error', 'message': f'updates must be a list of 1 to {BULK_MAX_ITEMS} items'}, 400, headers)
+
+    invalid = [
+        {'index': index, 'status': 'invalid', 'message': 'each update needs a target_phone and a boolean is_active'}
+        for index, item in enumerate(items)
+        if not isinstance(item, dict) or not item.get('target_phone') or not isinstance(item.get('is_active'), bool)
+    ]
+    if invalid:
+        return context.res.json({'status': 'error', 'message': 'No users were updated', 'results': invalid}, 400, headers)
+
+    updates = [(item['target_phone'], item['is_active']) for item in items]
+    results = [
+        {'index': index, 'target_phone': phone, **result}
+        for index, ((phone, _), result) in enumerate(zip(updates, db.update_user_statuses(updates)))
+    ]
+    status = 'success' if all(result['status'] == 'updated' for result in results) else 'partial'
+    return context.res.json({'status': status, 'results': results}, 200, headers)
+
 def handle_admin_stats(context, headers):
     data = get_json(context)
     user_phone = data.get('user_phone')
@@ -505,11 +2276,49 @@ def handle_admin_stats(context, headers):
     if not user or user.get('role') != 'admin':
         return context.res.json({'error': 'Unauthorized'}, 403, headers)
     
-    users = db.get_all_users()
     return context.res.json({
         'status': 'success', 
-        'stats': {
-            'total_users': len(users),
-            'active_users': len([u for u in users if u.get('is_active')])
-        }
+        'stats': db.get_stats()
     }, 200, headers)
+
+def handle_admin_export(context, headers):
+    # One page of a users/schedules dump per call; pass the X-Next-Cursor header back as
+    # `cursor` until it comes back empty. CSV pages after the first have no header row.
+    data = get_json(context)
+    user = db.get_user(data.get('user_phone'))
+    if not user or user.get('role') != 'admin':
+        return context.res.json({'error': 'Unauthorized'}, 403, headers)
+    kind = data.get('kind')
+    fmt = data.get('format') or 'ndjson'
+    if kind not in EXPORT_FIELDS or fmt not in EXPORT_FORMATS:
+        return context.res.json({'status': 'error', 'message': f"kind must be one of {', '.join(EXPORT_FIELDS)} and format one of {', '.join(EXPORT_FORMATS)}"}, 400, headers)
+    try:
+        limit = min(max(int(data.get('limit') or EXPORT_RESPONSE_ROWS), 1), EXPORT_MAX_RESPONSE_ROWS)
+    except (TypeError, ValueError):
+        return context.res.json({'status': 'error', 'message': 'limit must be an integer'}, 400, headers)
+
+    fields = export_fields(kind)
+    cursor = data.get('cursor')
+    iterate = db.iter_users if kind == 'users' else db.iter_schedules
+    # One extra row tells whether there is another page
+    rows = list(itertools.islice(iterate(fields, cursor), limit + 1))
+    next_cursor = ''
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['phone' if kind == 'users' else '$id']
+    body = ''.join(encode_rows(rows, fields, fmt, header=not cursor))
+    return context.res.send(body, 200, {
+        **headers,
+        'Content-Type': 'text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        'X-Next-Cursor': next_cursor
+    })
+
+def handle_admin_breakers(context, headers):
+    data = get_json(context)
+    user_phone = data.get('user_phone')
+    user = db.get_user(user_phone)
+    if not user or user.get('role') != 'admin':
+        return context.res.json({'error': 'Unauthorized'}, 403, headers)
+
+    breakers = [breaker.describe(UserRecord.from_document(u)) for u in db.get_tripped_users()]
+    return context.res.json({'status': 'success', 'breakers': breakers}, 200, headers)
@@ -0,0 +1,66 @@
+from main import db, user_doc_id, schedule_doc_id, DATABASE_ID, USERS_COLLECTION_ID, SCHEDULES_COLLECTION_ID
+from datetime import datetime
+
+# One-off migration: re-key users and schedules created with 'unique()' IDs to the
+# deterministic IDs main.py now reads and writes directly. Safe to run again; documents
+# that already have their deterministic ID are left alone.
+
+def fetch_all(collection_id):
+    documents = []
+    cursor = None
+    while True:
+        queries = [db.Query.limit(100)]
+        if cursor:
+            queries.append(db.Query.cursor_after(cursor))
+        page = db.databases.list_documents(DATABASE_ID, collection_id, queries)['documents']
+        documents.extend(page)
+        if len(page) < 100:
+            return documents
+        cursor = page[-1]['$id']
+
+def rekey(collection_id, document, new_id):
+    data = {k: v for k, v in document.items() if not k.startswith('$')}
+    try:
+        db.databases.create_document(DATABASE_ID, collection_id, new_id, data)
+    except db.AppwriteException as e:
+        if e.code != 409:
+            raise
+        # Either copied by an earlier, interrupted run, or a genuine clash (e.g. two
+        # documents for the same phone); only the first is safe to finish automatically
+        existing = db.databases.get_document(DATABASE_ID, collection_id, new_id)
+        if {k: existing.get(k) for k in data} != data:
+            print(f"  {new_id} already holds a different document; left {document['$id']} in place")
+            return False
+    db.databases.delete_document(DATABASE_ID, collection_id, document['$id'])
+    return True
+
+def created_ms(document):
+    return int(datetime.fromisoformat(document['$createdAt'].replace('Z', '+00:00')).timestamp() * 1000)
+
+def migrate():
+    if not hasattr(db, 'databases'):
+        print("Local database: schedule IDs are migrated automatically when the file is loaded.")
+        return
+
+    print("Migrating users...")
+    moved = 0
+    for user in fetch_all(USERS_COLLECTION_ID):
+        new_id = user_doc_id(user['phone'])
+        if user['$id'] != new_id:
+            print(f"  {user['phone']}: {user['$id']} -> {new_id}")
+            moved += rekey(USERS_COLLECTION_ID, user, new_id)
+    print(f"{moved} user(s) re-keyed.")
+
+    print("Migrating schedules...")
+    moved = 0
+    for schedule in fetch_all(SCHEDULES_COLLECTION_ID):
+        # "s<hash>-" prefix means it was already created with a deterministic ID
+        if schedule['$id'].startswith(schedule_doc_id(schedule['user_phone'], 0)[:-1]):
+            continue
+        new_id = schedule_doc_id(schedule['user_phone'], created_ms(schedule))
+        print(f"  {schedule['$id']} -> {new_id}")
+        moved += rekey(SCHEDULES_COLLECTION_ID, schedule, new_id)
+    print(f"{moved} schedule(s) re-keyed.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,48 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Opt-in request profiler. Off unless PROFILE_DIR is set; then a PROFILE_SAMPLE_RATE fraction of
+# requests (plus any request sent with "X-Profile: 1") is run under cProfile and dumped to
+# <PROFILE_DIR>/<method>_<route>-<ns>.prof. Inspect with `python -m pstats <file>` or snakeviz.
+# main.py carries the same helpers for the Appwrite Function, which is deployed on its own.
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_HEADER = "x-profile"
+
+# cProfile hooks the whole interpreter thread (and, on 3.12+, the whole process), so only one
+# request is profiled at a time. With concurrent async requests the profile also includes
+# whatever else ran on the loop meanwhile; the route in the file name is the one that was sampled.
+# Before 3.12, work handed to other threads (asyncio.to_thread, executors) shows up only as the wait.
+_profiling = threading.Lock()
+
+def should_profile(headers) -> bool:
+    if not PROFILE_DIR:
+        return False
+    if str(headers.get(PROFILE_HEADER, "")).strip() == "1":
+        return True
+    return random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile() -> Optional[cProfile.Profile]:
+    if not _profiling.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profile(profiler: cProfile.Profile, method: str, path: str):
+    profiler.disable()
+    _profiling.release()
+    route = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{method.lower()}_{route}-{time.time_ns()}.prof"))
+    except OSError as e:
+        logger.warning("Failed to write profile for %s %s: %s", method, path, e)
@@ -12,6 +12,11 @@ APPWRITE_API_KEY = os.environ.get("APPWRITE_API_KEY")
 DATABASE_ID = os.environ.get("DATABASE_ID")
 USERS_COLLECTION_ID = os.environ.get("USERS_COLLECTION_ID")
 SCHEDULES_COLLECTION_ID = os.environ.get("SCHEDULES_COLLECTION_ID")
+MEDIA_CACHE_COLLECTION_ID = os.environ.get("MEDIA_CACHE_COLLECTION_ID", "media_cache")
+COUNTERS_COLLECTION_ID = os.environ.get("COUNTERS_COLLECTION_ID", "counters")
+CHAT_CAPS_COLLECTION_ID = os.environ.get("CHAT_CAPS_COLLECTION_ID", "chat_caps")
+DELIVERIES_COLLECTION_ID = os.environ.get("DELIVERIES_COLLECTION_ID", "deliveries")
+LEDGER_COLLECTION_ID = os.environ.get("LEDGER_COLLECTION_ID", "delivery_ledger")
 
 client = Client()
 client.set_endpoint(APPWRITE_ENDPOINT)
@@ -20,6 +25,15 @@ client.set_key(APPWRITE_API_KEY)
 
 databases = Databases(client)
 
+def add_attribute(create, *args):
+    try:
+        create(*args)
+    except AppwriteException as e:
+        if e.code == 409:
+            print(f"Attribute '{args[2]}' already exists.")
+        else:
+            print(f"Error creating attribute '{args[2]}': {e}")
+
 def setup():
     print("Setting up Appwrite Database...")
     
@@ -54,6 +68,17 @@ def setup():
             print(f"Error checking users collection: {e}")
 
     # 3. Create Schedules Collection
+    try:
+        databases.get_collection(DATABASE_ID, SCHEDULES_COLLECTION_ID)
+        print(f"Collection '{SCHEDULES_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{SCHEDULES_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, SCHEDULES_COLLECTION_ID, SCHEDULES_COLLECTION_ID)
+
+            print("Creating attributes for schedules...")
+            databases.create_string_attribute(DATABASE_ID, SCHEDULES_COLLECTION_ID, "user_phone", 20, True)
+            databases.create_string_attribute(DATABASE_ID, SCHEDULES_COLLECTION_ID, "message", 4096, False)
             # We can use a string array or just a stringified JSON.
             # Appwrite supports Integer attributes, and array=True.
             databases.create_integer_attribute(DATABASE_ID, SCHEDULES_COLLECTION_ID, "groups", True) 
@@ -62,6 +87,111 @@ def setup():
         else:
             print(f"Error checking schedules collection: {e}")
 
+    # 4. Create Media Cache Collection (per-account Telegram file_ids for schedule attachments)
+    try:
+        databases.get_collection(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID)
+        print(f"Collection '{MEDIA_CACHE_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{MEDIA_CACHE_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID, MEDIA_CACHE_COLLECTION_ID)
+
+            print("Creating attributes for media cache...")
+            databases.create_string_attribute(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID, "phone", 20, True)
+            databases.create_string_attribute(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID, "source", 2048, True)
+            databases.create_string_attribute(DATABASE_ID, MEDIA_CACHE_COLLECTION_ID, "file_id", 255, True)
+        else:
+            print(f"Error checking media cache collection: {e}")
+
+    # 5. Create Counters Collection (one document per day: sends-YYYY-MM-DD)
+    try:
+        databases.get_collection(DATABASE_ID, COUNTERS_COLLECTION_ID)
+        print(f"Collection '{COUNTERS_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{COUNTERS_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, COUNTERS_COLLECTION_ID, COUNTERS_COLLECTION_ID)
+
+            print("Creating attributes for counters...")
+            databases.create_integer_attribute(DATABASE_ID, COUNTERS_COLLECTION_ID, "count", False, None, None, 0)
+        else:
+            print(f"Error checking counters collection: {e}")
+
+    # 6. Create Chat Capabilities Collection (per account and chat: can it post, slow mode)
+    try:
+        databases.get_collection(DATABASE_ID, CHAT_CAPS_COLLECTION_ID)
+        print(f"Collection '{CHAT_CAPS_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{CHAT_CAPS_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, CHAT_CAPS_COLLECTION_ID, CHAT_CAPS_COLLECTION_ID)
+
+            print("Creating attributes for chat capabilities...")
+            databases.create_string_attribute(DATABASE_ID, CHAT_CAPS_COLLECTION_ID, "phone", 20, True)
+            databases.create_string_attribute(DATABASE_ID, CHAT_CAPS_COLLECTION_ID, "chat_id", 32, True)
+            databases.create_string_attribute(DATABASE_ID, CHAT_CAPS_COLLECTION_ID, "caps", 1024, True)
+        else:
+            print(f"Error checking chat capabilities collection: {e}")
+
+    # 7. Create Deliveries Collection (append-only log of every send attempt)
+    try:
+        databases.get_collection(DATABASE_ID, DELIVERIES_COLLECTION_ID)
+        print(f"Collection '{DELIVERIES_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{DELIVERIES_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, DELIVERIES_COLLECTION_ID, DELIVERIES_COLLECTION_ID)
+
+            print("Creating attributes for deliveries...")
+            databases.create_string_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "schedule_id", 36, True)
+            databases.create_string_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "user_phone", 20, True)
+            databases.create_string_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "chat_id", 32, True)
+            databases.create_string_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "status", 20, True)
+            databases.create_integer_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "latency_ms", False, None, None, 0)
+            databases.create_string_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "error_class", 100, False, "")
+            databases.create_integer_attribute(DATABASE_ID, DELIVERIES_COLLECTION_ID, "ts", True)
+            # /deliveries filters on user_phone and sorts on ts; add a key index on both in the console
+        else:
+            print(f"Error checking deliveries collection: {e}")
+
+    # 8. Create Delivery Ledger Collection (one entry per schedule/run slot/chat, keyed by ID)
+    try:
+        databases.get_collection(DATABASE_ID, LEDGER_COLLECTION_ID)
+        print(f"Collection '{LEDGER_COLLECTION_ID}' already exists.")
+    except AppwriteException as e:
+        if e.code == 404:
+            print(f"Creating collection '{LEDGER_COLLECTION_ID}'...")
+            databases.create_collection(DATABASE_ID, LEDGER_COLLECTION_ID, LEDGER_COLLECTION_ID)
+
+            print("Creating attributes for delivery ledger...")
+            databases.create_integer_attribute(DATABASE_ID, LEDGER_COLLECTION_ID, "expires_at", True)
+            databases.create_string_attribute(DATABASE_ID, LEDGER_COLLECTION_ID, "state", 10, False)
+            databases.create_integer_attribute(DATABASE_ID, LEDGER_COLLECTION_ID, "lease_until", False, None, None, 0)
+            # The scheduler prunes on expires_at every pass; add a key index on it in the console
+        else:
+            print(f"Error checking delivery ledger collection: {e}")
+
+    # 9. Attributes added after the initial release (skipped if they already exist)
+    print("Ensuring newer attributes...")
+    add_attribute(databases.create_string_attribute, DATABASE_ID, USERS_COLLECTION_ID, "breaker_state", 20, False, "closed")
+    add_attribute(databases.create_integer_attribute, DATABASE_ID, USERS_COLLECTION_ID, "breaker_opened_at", False, None, None, 0)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, USERS_COLLECTION_ID, "breaker_reason", 100, False, "")
+    add_attribute(databases.create_integer_attribute, DATABASE_ID, USERS_COLLECTION_ID, "schedules_version", False, None, None, 0)
+    add_attribute(databases.create_integer_attribute, DATABASE_ID, USERS_COLLECTION_ID, "groups_version", False, None, None, 0)
+    add_attribute(databases.create_integer_attribute, DATABASE_ID, USERS_COLLECTION_ID, "groups_cached_at", False, None, None, 0)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, USERS_COLLECTION_ID, "groups_cache", 65535, False)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, SCHEDULES_COLLECTION_ID, "media_type", 20, False)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, SCHEDULES_COLLECTION_ID, "media_url", 2048, False)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, SCHEDULES_COLLECTION_ID, "last_outcomes", 65535, False)
+    add_attribute(databases.create_string_attribute, DATABASE_ID, LEDGER_COLLECTION_ID, "state", 10, False)
+    add_attribute(databases.create_integer_attribute, DATABASE_ID, LEDGER_COLLECTION_ID, "lease_until", False, None, None, 0)
+
+    # Media-only schedules have no message, so it is no longer required
+    try:
+        databases.update_string_attribute(DATABASE_ID, SCHEDULES_COLLECTION_ID, "message", False, None)
+    except AppwriteException as e:
+        print(f"Error making attribute 'message' optional: {e}")
+
     print("Setup complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# loadtest.py points main.py at throwaway local storage before importing it, and carries the
+# fake Appwrite context and stubbed Telegram client these tests drive main() with
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import loadtest  # noqa: E402
+import main  # noqa: E402
+
+loadtest.StubTelegramBot.latency = 0.001
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A fresh local store (and delivery log and ledger) per test
+    monkeypatch.setattr(main, "LOCAL_DB_FILE", str(tmp_path / "db.json"))
+    monkeypatch.setattr(main, "DELIVERY_LOG_FILE", str(tmp_path / "deliveries.jsonl"))
+    monkeypatch.setattr(main, "LEDGER_FILE", str(tmp_path / "delivery_ledger.jsonl"))
+    database = main.LocalDatabase()
+    monkeypatch.setattr(main, "db", database)
+    monkeypatch.setattr(main, "breaker", main.AccountBreaker(database))
+    monkeypatch.setattr(main, "TelegramBot", loadtest.StubTelegramBot)
+    return database
+
+
+def call(path, body=None, headers=None):
+    # Runs one request through main(context); JSON bodies are decoded
+    response = asyncio.run(main.main(loadtest.FakeContext({
+        "method": "POST",
+        "path": path,
+        "headers": headers or {},
+        "body": body or {}
+    })))
+    if isinstance(response["body"], dict) or not response["body"]:
+        return response
+    try:
+        response["body"] = json.loads(response["body"])
+    except ValueError:
+        pass
+    return response
@@ -0,0 +1,58 @@
+import pytest
+
+from conftest import call
+
+SCHEDULE = {"message": "hello", "groups": [-1001, -1002], "interval": 5}
+
+
+def test_bulk_create_schedules(db):
+    db.save_user("+1", "session-1")
+    etag = call("/schedules", {"user_phone": "+1"})["headers"]["ETag"]
+
+    response = call("/schedules/bulk", {"user_phone": "+1", "schedules": [SCHEDULE, {**SCHEDULE, "interval": 10}]})
+
+    assert response["status"] == 200
+    assert response["body"]["status"] == "success"
+    assert [r["status"] for r in response["body"]["results"]] == ["created", "created"]
+    assert len(db.get_user_schedules("+1")) == 2
+    assert call("/schedules", {"user_phone": "+1", "version": etag})["status"] == 200
+
+
+@pytest.mark.parametrize("bad", [
+    {"media": "not an object"},
+    {"groups": ["-1001"]},
+    {"groups": [True]},
+    {"message": None},
+    {"interval": "often"},
+])
+def test_one_invalid_item_rejects_the_whole_batch(db, bad):
+    db.save_user("+1", "session-1")
+
+    response = call("/schedules/bulk", {"user_phone": "+1", "schedules": [SCHEDULE, {**SCHEDULE, **bad}]})
+
+    assert response["status"] == 400
+    assert [r["index"] for r in response["body"]["results"]] == [1]
+    assert db.get_user_schedules("+1") == []
+
+
+def test_single_create_rejects_malformed_media(db):
+    db.save_user("+1", "session-1")
+    response = call("/schedule", {"user_phone": "+1", **SCHEDULE, "media": ["x"]})
+    assert response["status"] == 400
+
+
+def test_bulk_user_status(db):
+    db.save_user("+100", "session-admin", "admin")
+    db.save_user("+1", "session-1")
+    db.save_user("+2", "session-2")
+
+    response = call("/admin/user_status/bulk", {"user_phone": "+100", "updates": [
+        {"target_phone": "+1", "is_active": False},
+        {"target_phone": "+9", "is_active": False},
+    ]})
+
+    assert response["status"] == 200
+    assert response["body"]["status"] == "partial"
+    assert [r["status"] for r in response["body"]["results"]] == ["updated", "not_found"]
+    assert db.get_user("+1")["is_active"] is False
+    assert db.get_stats()["active_users"] == 2
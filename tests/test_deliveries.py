@@ -0,0 +1,65 @@
+import main
+from conftest import call
+
+
+def records(phone, count, start=0):
+    return [{"user_phone": phone, "chat_id": -1000 - i, "status": "sent", "ts": start + i} for i in range(count)]
+
+
+def page_through(phone, limit):
+    pages = []
+    cursor = None
+    while True:
+        body = {"user_phone": phone, "limit": limit}
+        if cursor:
+            body["cursor"] = cursor
+        response = call("/deliveries", body)
+        assert response["status"] == 200
+        pages.append([d["ts"] for d in response["body"]["deliveries"]])
+        cursor = response["body"]["next_cursor"]
+        if not cursor:
+            return pages
+
+
+def test_pages_are_newest_first_and_per_user(db):
+    db.append_deliveries(records("+1", 5))
+    db.append_deliveries(records("+2", 3, start=100))
+    db.append_deliveries(records("+1", 2, start=5))
+
+    assert page_through("+1", 3) == [[6, 5, 4], [3, 2, 1], [0]]
+    assert page_through("+2", 3) == [[102, 101, 100]]
+    assert page_through("+3", 3) == [[]]
+
+
+def test_records_appended_between_calls_are_picked_up(db):
+    db.append_deliveries(records("+1", 2))
+    assert page_through("+1", 10) == [[1, 0]]
+
+    db.append_deliveries(records("+1", 2, start=2))
+    assert page_through("+1", 10) == [[3, 2, 1, 0]]
+
+
+def test_invalid_cursor_is_a_bad_request(db):
+    db.append_deliveries(records("+1", 2))
+    for cursor in ("abc", "-1", 5, "a b"):
+        response = call("/deliveries", {"user_phone": "+1", "cursor": cursor})
+        assert response["status"] == 400, cursor
+
+
+def test_failed_append_is_retried_on_next_flush(db, monkeypatch):
+    buffer = main.WriteBehindBuffer(db)
+    schedule = main.ScheduleRecord("s1", "+1", "hello", [-1001], 5)
+    append = db.append_deliveries
+
+    def fail(records):
+        raise RuntimeError("backend down")
+
+    monkeypatch.setattr(db, "append_deliveries", fail)
+    buffer.record(schedule, -1001, "sent")
+    buffer.flush()
+    assert len(buffer.deliveries) == 1
+
+    monkeypatch.setattr(db, "append_deliveries", append)
+    buffer.flush()
+    assert buffer.deliveries == []
+    assert [d["chat_id"] for d in db.get_deliveries("+1", 10)["deliveries"]] == [-1001]
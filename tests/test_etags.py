@@ -0,0 +1,49 @@
+from conftest import call
+
+
+def test_schedules_not_modified_for_same_version(db):
+    db.save_user("+1", "session-1")
+    db.add_schedule("+1", "hello", [-1001], 5)
+
+    first = call("/schedules", {"user_phone": "+1"})
+    assert first["status"] == 200
+    etag = first["headers"]["ETag"]
+
+    assert call("/schedules", {"user_phone": "+1"}, {"if-none-match": etag})["status"] == 304
+    assert call("/schedules", {"user_phone": "+1", "version": etag})["status"] == 304
+
+
+def test_schedules_etag_changes_when_a_schedule_is_added(db):
+    db.save_user("+1", "session-1")
+    etag = call("/schedules", {"user_phone": "+1"})["headers"]["ETag"]
+
+    db.add_schedule("+1", "hello", [-1001], 5)
+
+    response = call("/schedules", {"user_phone": "+1", "version": etag})
+    assert response["status"] == 200
+    assert response["headers"]["ETag"] != etag
+    assert len(response["body"]["schedules"]) == 1
+
+
+def test_etag_of_one_user_never_matches_another(db):
+    db.save_user("+1", "session-1")
+    db.save_user("+2", "session-2")
+    db.add_schedule("+1", "one", [-1001], 5)
+    db.add_schedule("+2", "two", [-1002], 5)
+
+    etag = call("/schedules", {"user_phone": "+1"})["headers"]["ETag"]
+
+    response = call("/schedules", {"user_phone": "+2", "version": etag})
+    assert response["status"] == 200
+    assert [s["message"] for s in response["body"]["schedules"]] == ["two"]
+
+
+def test_groups_served_from_cache_with_etag(db):
+    db.save_user("+1", "session-1")
+    body = {"user_phone": "+1", "session_string": "session-1"}
+
+    first = call("/groups", body)
+    assert first["status"] == 200
+    etag = first["headers"]["ETag"]
+
+    assert call("/groups", {**body, "version": etag})["status"] == 304
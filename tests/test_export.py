@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+import main
+from conftest import call
+
+
+def make_admin(db):
+    db.save_user("+100", "session-admin", "admin")
+    return {"user_phone": "+100"}
+
+
+@pytest.mark.parametrize("fmt", main.EXPORT_FORMATS)
+def test_rows_round_trip(fmt):
+    fields = main.EXPORT_FIELDS["schedules"]
+    rows = [
+        {"$id": "s1", "user_phone": "+1", "message": "hello, \"world\"", "groups": [-1001, -1002],
+         "interval_minutes": 5, "last_run": 0, "media_type": None, "media_url": None},
+        {"$id": "s2", "user_phone": "+2", "message": "line\nbreak", "groups": [-1003],
+         "interval_minutes": 60, "last_run": 1700000000, "media_type": "photo", "media_url": "https://example.com/a.png"},
+    ]
+    encoded = "".join(main.encode_rows(rows, fields, fmt))
+    decoded = list(main.decode_rows(io.StringIO(encoded, newline=""), fmt))
+    assert [main.import_document(row) for row in decoded] == [main.import_document(row) for row in rows]
+
+
+@pytest.mark.parametrize("fmt", main.EXPORT_FORMATS)
+def test_admin_export_pages_until_cursor_is_empty(db, fmt):
+    admin = make_admin(db)
+    for i in range(5):
+        db.save_user(f"+2{i}", f"session-{i}")
+
+    chunks, cursor = [], None
+    while True:
+        body = {**admin, "kind": "users", "format": fmt, "limit": 2}
+        if cursor:
+            body["cursor"] = cursor
+        response = call("/admin/export", body)
+        assert response["status"] == 200
+        chunks.append(response["body"])
+        cursor = response["headers"]["X-Next-Cursor"]
+        if not cursor:
+            break
+
+    assert len(chunks) == 3
+    users = list(main.decode_rows(io.StringIO("".join(chunks), newline=""), fmt))
+    assert [u["phone"] for u in users] == ["+100"] + [f"+2{i}" for i in range(5)]
+    assert all("session_string" not in u for u in users)
+
+
+def test_admin_export_requires_admin(db):
+    db.save_user("+1", "session-1")
+    assert call("/admin/export", {"user_phone": "+1", "kind": "users"})["status"] == 403
+
+
+def test_import_upserts_schedules_by_id(db):
+    db.save_user("+1", "session-1")
+    db.add_schedule("+1", "old", [-1001], 5)
+    existing = db.get_user_schedules("+1")[0]["$id"]
+
+    imported = db.import_schedules([
+        {"$id": existing, "user_phone": "+1", "message": "new", "groups": ["-1001"], "interval_minutes": 5},
+        {"user_phone": "+1", "message": "added", "groups": [-1002], "interval_minutes": 10},
+    ])
+
+    assert imported == 2
+    schedules = {s["message"]: s for s in db.get_user_schedules("+1")}
+    assert set(schedules) == {"new", "added"}
+    assert schedules["new"]["$id"] == existing
+    assert schedules["new"]["groups"] == [-1001]
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from multiprocessing import get_context
+
+import pytest
+
+import loadtest
+import main
+from conftest import call
+
+CHATS = [-1, -2, -3]
+
+
+class Killed(BaseException):
+    # Not an Exception, so nothing in run_scheduler catches it: the pass dies mid-send
+    pass
+
+
+class RecordingBot(loadtest.StubTelegramBot):
+    sent = []
+    kill_on = None
+
+    async def send_message(self, chat_id, text):
+        if chat_id == self.kill_on:
+            RecordingBot.kill_on = None
+            raise Killed()
+        await super().send_message(chat_id, text)
+        RecordingBot.sent.append(chat_id)
+
+
+@pytest.fixture
+def bot(db, monkeypatch):
+    RecordingBot.sent = []
+    RecordingBot.kill_on = None
+    monkeypatch.setattr(main, "TelegramBot", RecordingBot)
+    db.save_user("+1", "session-1")
+    db.add_schedule("+1", "hello", CHATS, 5)
+    return RecordingBot
+
+
+def set_lease(monkeypatch, seconds):
+    monkeypatch.setattr(main.DeliveryLedger.__init__, "__defaults__", (seconds,))
+
+
+def test_crashed_pass_resumes_where_it_stopped(db, bot, monkeypatch):
+    set_lease(monkeypatch, 1)
+    bot.kill_on = -2
+    with pytest.raises(Killed):
+        call("/cron")
+    assert bot.sent == [-1]
+
+    # Within the lease the chat may still be in flight: leave it, and keep the schedule due
+    summary = call("/cron")["body"]["summary"]
+    assert bot.sent == [-1, -3]
+    assert summary["duplicates"] == 2
+    assert db.get_user_schedules("+1")[0]["last_run"] == 0
+
+    time.sleep(1.1)
+    summary = call("/cron")["body"]["summary"]
+    assert bot.sent == [-1, -3, -2]
+    assert summary["sent"] == 1
+
+    # Run mark written; nothing is due any more
+    assert call("/cron")["body"]["summary"]["due"] == 0
+    assert bot.sent == [-1, -3, -2]
+
+
+def test_overlapping_passes_send_each_chat_once(db, bot):
+    async def two_passes():
+        context = lambda: loadtest.FakeContext({"method": "POST", "path": "/cron", "body": {}})
+        return await asyncio.gather(main.main(context()), main.main(context()))
+
+    responses = asyncio.run(two_passes())
+
+    assert sorted(bot.sent) == sorted(CHATS)
+    assert sum(r["body"]["summary"]["sent"] for r in responses) == len(CHATS)
+
+
+def test_failed_send_releases_the_claim(db, bot, monkeypatch):
+    async def flaky(self, chat_id, text):
+        raise RuntimeError("network")
+
+    monkeypatch.setattr(RecordingBot, "send_message", flaky)
+    assert call("/cron")["body"]["summary"]["failed"] == len(CHATS)
+    assert {entry["state"] for entry in db.ledger.values()} == {"released"}
+
+    state, token = db.claim_delivery(next(iter(db.ledger)), int(time.time()) + 60, int(time.time()) + 60)
+    assert state == "claimed"
+
+
+def test_slow_mode_skip_does_not_claim(db, bot, monkeypatch):
+    async def check(self, bot, phone, chat_id, media):
+        return "slow_mode" if chat_id == -2 else None
+
+    monkeypatch.setattr(main.ChatCapabilityCache, "check", check)
+    summary = call("/cron")["body"]["summary"]
+
+    assert summary["skipped"] == 1
+    assert sorted(bot.sent) == [-3, -1]
+    assert len(db.ledger) == 2
+
+
+def test_prune_keeps_live_entries(db):
+    now = int(time.time())
+    db.claim_delivery("expired", now - 1, now - 1)
+    db.claim_delivery("live", now + 60, now + 60)
+
+    assert db.prune_ledger() == 1
+    assert set(db.ledger) == {"live"}
+    assert main.LocalDatabase().claim_delivery("live", now + 60, now + 60) == ("pending", None)
+
+
+def claim_all(ledger_file):
+    main.LEDGER_FILE = ledger_file
+    database = main.LocalDatabase()
+    won = []
+    for k in range(100):
+        now = int(time.time())
+        if database.claim_delivery(f"key-{k}", now + 60, now + 60)[0] == "claimed":
+            won.append(k)
+        if k % 25 == 0:
+            database.prune_ledger()
+    return won
+
+
+def test_claims_from_concurrent_processes_are_exclusive(db):
+    with get_context("fork").Pool(4) as pool:
+        results = pool.map(claim_all, [main.LEDGER_FILE] * 4)
+    won = [k for result in results for k in result]
+    assert sorted(won) == list(range(100))
+    assert os.path.exists(main.LEDGER_FILE)
@@ -0,0 +1,46 @@
+import json
+import tracemalloc
+
+import main
+from conftest import call
+
+
+def sent_chats(db):
+    return sorted(d["chat_id"] for d in db.get_deliveries("+1", 100)["deliveries"] if d["status"] == "sent")
+
+
+def test_malformed_schedule_does_not_stop_the_others(db):
+    db.save_user("+1", "session-1")
+    db.add_schedule("+1", "first", [-1001], 5)
+    db.data["schedules"].append({"$id": "bad-groups", "user_phone": "+1", "message": "x", "groups": ["abc"], "interval_minutes": 5, "last_run": 0})
+    db.data["schedules"].append({"$id": "bad-interval", "user_phone": "+1", "message": "x", "groups": [-1], "interval_minutes": "x", "last_run": 0})
+    db.data["schedules"].append({"$id": "numeric-string", "user_phone": "+1", "message": "x", "groups": ["-1003"], "interval_minutes": 5, "last_run": 0})
+    db.add_schedule("+1", "last", [-1002], 5)
+
+    response = call("/cron")
+
+    assert response["status"] == 200
+    assert response["body"]["summary"]["run"] == 3
+    assert response["body"]["summary"]["sent"] == 3
+    assert sent_chats(db) == [-1003, -1002, -1001]
+
+
+def test_schedule_records_take_less_memory_than_documents(db):
+    # The reason get_due_schedules holds ScheduleRecords rather than the documents a backend
+    # page decodes to; each document is parsed on its own, as with a real page
+    encoded = []
+    for i in range(2000):
+        document = main.schedule_document("+1", "the same message", [-1000000000000 - g for g in range(5)], 5)
+        encoded.append(json.dumps({"$id": f"s{i}", **document}))
+
+    def allocated(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    as_documents = allocated(lambda: [json.loads(document) for document in encoded])
+    as_records = allocated(lambda: [main.ScheduleRecord.from_document(json.loads(document)) for document in encoded])
+    assert as_records < as_documents / 2